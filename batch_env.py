@@ -0,0 +1,203 @@
+from simulation import TILE_SIZE, MOVES, EXIT_CLUES, FLAGS, MazeSimulation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class BatchMazeEnv:
+    """Steps many independent MazeSimulation games at once with NumPy.
+
+    Player positions, flags and the door tiles (every tile a trigger can write) live in arrays
+    with one row per game, so movement, collision and triggers run once per step for all games.
+    Each game follows exactly the rules of MazeSimulation.step.
+    """
+
+    def __init__(self, num_envs, map_file=None):
+        if np is None:
+            raise ImportError("BatchMazeEnv needs the 'numpy' package")
+        self.num_envs = num_envs
+
+        # One headless game provides the map, the triggers and the state every game starts from
+        template = MazeSimulation(map_file)
+        self.width = template.map_width
+        self.height = template.map_height
+        self.zones = template.triggers.zones
+        self.start_position = template.player_rect.topleft
+
+        # Door tiles get a column in door_state; the rest of the map never changes
+        self.door_index = np.full((self.height, self.width), -1, dtype=np.int32)
+        self.door_tiles = []
+        self.action_columns = {}
+        for zone in self.zones:
+            for kind, target, value, condition in zone.enter + zone.exit + zone.inside:
+                if kind == 'tiles' and target not in self.action_columns:
+                    self.action_columns[target] = np.array(self.door_columns(*target), dtype=np.int32)
+        layout = np.frombuffer(bytes(template.map_layout.data), dtype=np.uint8).reshape(self.height, self.width)
+        self.static_walls = (layout == 0) & (self.door_index < 0)
+        self.start_doors = np.array([template.map_creation[x, y] for x, y in self.door_tiles] or [1],
+                                    dtype=np.uint8)
+
+        self.tile_zones = np.zeros((self.height, self.width, len(self.zones)), dtype=bool)
+        for zone_id, zone in enumerate(self.zones):
+            for x, y in zone.tiles():
+                if 0 <= x < self.width and 0 <= y < self.height:
+                    self.tile_zones[y, x, zone_id] = True
+        self.watchers = [[zone_id for zone_id, zone in enumerate(self.zones) if flag in zone.watch]
+                         for flag in FLAGS + ('exit_clue',)]
+        self.start_flags = {flag: getattr(template, flag) for flag in FLAGS}
+        self.start_exit_clue = list(template.exit_clue)
+
+        self.moves = np.array(MOVES, dtype=np.int32)
+        self.x = np.zeros(num_envs, dtype=np.int32)
+        self.y = np.zeros(num_envs, dtype=np.int32)
+        self.flags = {flag: np.zeros(num_envs, dtype=bool) for flag in FLAGS}
+        self.exit_clue = np.zeros((num_envs, EXIT_CLUES), dtype=bool)
+        self.door_state = np.zeros((num_envs, len(self.start_doors)), dtype=np.uint8)
+        self.active_zones = np.zeros((num_envs, len(self.zones)), dtype=bool)
+        self.reset()
+
+    def door_columns(self, start_x, start_y, end_x, end_y):
+        columns = []
+        for y in range(max(start_y, 0), min(end_y, self.height - 1) + 1):
+            for x in range(max(start_x, 0), min(end_x, self.width - 1) + 1):
+                if self.door_index[y, x] < 0:
+                    self.door_index[y, x] = len(self.door_tiles)
+                    self.door_tiles.append((x, y))
+                columns.append(self.door_index[y, x])
+        return columns
+
+    @property
+    def done(self):
+        return self.flags['is_trapped'] | self.flags['instantDeath'] | self.flags['game_over']
+
+    def reset(self, mask=None):
+        """Restart every game, or only the games where mask is True."""
+        mask = np.ones(self.num_envs, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        self.x[mask], self.y[mask] = self.start_position
+        for flag in FLAGS:
+            self.flags[flag][mask] = self.start_flags[flag]
+        self.exit_clue[mask] = self.start_exit_clue
+        self.door_state[mask] = self.start_doors
+        self.active_zones[mask] = False
+
+    def positions(self):
+        return np.stack([self.x, self.y], axis=1)
+
+    def player_tiles(self, x, y):
+        # The player is one tile wide, so it overlaps at most a 2x2 block of tiles
+        for tile_x in (x // TILE_SIZE, (x + TILE_SIZE - 1) // TILE_SIZE):
+            for tile_y in (y // TILE_SIZE, (y + TILE_SIZE - 1) // TILE_SIZE):
+                on_map = (tile_x >= 0) & (tile_x < self.width) & (tile_y >= 0) & (tile_y < self.height)
+                yield np.clip(tile_x, 0, self.width - 1), np.clip(tile_y, 0, self.height - 1), on_map
+
+    def wall_at(self, tile_x, tile_y):
+        """Per game, whether tile (tile_x, tile_y) is a wall in it; tiles off the map are not."""
+        on_map = (tile_x >= 0) & (tile_x < self.width) & (tile_y >= 0) & (tile_y < self.height)
+        tile_x, tile_y = np.clip(tile_x, 0, self.width - 1), np.clip(tile_y, 0, self.height - 1)
+        door = self.door_index[tile_y, tile_x]
+        door_wall = self.door_state[np.arange(self.num_envs), np.maximum(door, 0)] == 0
+        return on_map & np.where(door >= 0, door_wall, self.static_walls[tile_y, tile_x])
+
+    def collides_with_wall(self, x, y):
+        hit = np.zeros(self.num_envs, dtype=bool)
+        for tile_x in (x // TILE_SIZE, (x + TILE_SIZE - 1) // TILE_SIZE):
+            for tile_y in (y // TILE_SIZE, (y + TILE_SIZE - 1) // TILE_SIZE):
+                hit |= self.wall_at(tile_x, tile_y)
+        return hit
+
+    def sweep(self, position, other, delta, horizontal):
+        """MazeSimulation.sweep_x (or sweep_y) for every game: how far each moves by delta along one axis.
+
+        Lines of tiles the leading edge crosses are checked nearest first, one per round for all
+        games together, and a game stops flush against the first line with a wall in it.
+        """
+        forward = delta > 0
+        # The line of tiles just past the player's leading edge, and how many lines the move crosses
+        edge = np.where(forward, (position + TILE_SIZE - 1) // TILE_SIZE + 1, position // TILE_SIZE - 1)
+        end = np.where(forward, (position + TILE_SIZE + delta - 1) // TILE_SIZE, (position + delta) // TILE_SIZE)
+        lines = np.maximum(np.where(forward, end - edge, edge - end) + 1, 0)
+        lines[delta == 0] = 0
+        step = np.where(forward, 1, -1)
+        allowed = delta.copy()
+        open_so_far = np.ones(self.num_envs, dtype=bool)
+        for crossed in range(int(lines.max(initial=0))):
+            line = edge + step * crossed
+            hit = np.zeros(self.num_envs, dtype=bool)
+            for across in (other // TILE_SIZE, (other + TILE_SIZE - 1) // TILE_SIZE):
+                hit |= self.wall_at(line, across) if horizontal else self.wall_at(across, line)
+            blocked = open_so_far & (crossed < lines) & hit
+            allowed[blocked] = np.where(forward, line * TILE_SIZE - position - TILE_SIZE,
+                                        (line + 1) * TILE_SIZE - position)[blocked]
+            open_so_far &= ~blocked
+        return allowed
+
+    def step(self, actions):
+        """Advance every game that is not over by one tick; actions holds one bitmask per game."""
+        alive = ~self.done
+        dx, dy = self.moves[np.asarray(actions) & 15].T
+        dx, dy = np.where(alive, dx, 0), np.where(alive, dy, 0)
+        # x first, then y from where x ended, as MazeSimulation.step slides along walls
+        new_x = self.x + self.sweep(self.x, self.y, dx, True)
+        new_y = self.y + self.sweep(self.y, new_x, dy, False)
+        # Games whose player a door closed on only take moves that step out of it
+        back = self.collides_with_wall(self.x, self.y) & self.collides_with_wall(new_x, new_y)
+        new_x, new_y = np.where(back, self.x, new_x), np.where(back, self.y, new_y)
+        new_x = new_x.clip(0, (self.width - 1) * TILE_SIZE)
+        new_y = new_y.clip(0, (self.height - 1) * TILE_SIZE)
+        self.x = np.where(alive, new_x, self.x).astype(np.int32)
+        self.y = np.where(alive, new_y, self.y).astype(np.int32)
+        self.map_logic(alive)
+        return self.done
+
+    def map_logic(self, alive):
+        current = np.zeros_like(self.active_zones)
+        for tile_x, tile_y, on_map in self.player_tiles(self.x, self.y):
+            current |= self.tile_zones[tile_y, tile_x] & on_map[:, None]
+        entered = current & ~self.active_zones & alive[:, None]
+        exited = self.active_zones & ~current & alive[:, None]
+        self.active_zones[alive] = current[alive]
+
+        changed = {}
+        for zone_id, zone in enumerate(self.zones):
+            if entered[:, zone_id].any():
+                self.run(zone.enter, entered[:, zone_id], changed)
+            if exited[:, zone_id].any():
+                self.run(zone.exit, exited[:, zone_id], changed)
+        for zone_id, zone in enumerate(self.zones):
+            if zone.inside:
+                self.run(zone.inside, current[:, zone_id] & alive, changed)
+
+        # Same as TriggerEngine: zones watching a flag that changed re-apply their current state
+        refresh = np.zeros_like(self.active_zones)
+        for flag, zone_ids in zip(FLAGS + ('exit_clue',), self.watchers):
+            if flag in changed:
+                refresh[:, zone_ids] |= changed[flag][:, None]
+        for zone_id, zone in enumerate(self.zones):
+            if refresh[:, zone_id].any():
+                self.run(zone.enter, refresh[:, zone_id] & current[:, zone_id], {})
+                self.run(zone.exit, refresh[:, zone_id] & ~current[:, zone_id], {})
+
+    def condition(self, condition):
+        if condition is None:
+            return True
+        name = condition.lstrip('!')
+        if name == 'can_exit':
+            value = self.flags['is_eligible'] & self.exit_clue.all(axis=1)
+        else:
+            value = self.flags[name]
+        return ~value if condition.startswith('!') else value
+
+    def run(self, actions, mask, changed):
+        for kind, target, value, condition in actions:
+            selected = mask & self.condition(condition)
+            if not selected.any():
+                continue
+            if kind == 'tiles':
+                self.door_state[np.ix_(np.flatnonzero(selected), self.action_columns[target])] = value
+                continue
+            name, index = target
+            flag = self.flags[name] if index is None else self.exit_clue[:, index]
+            changed[name] = changed.get(name, False) | (selected & (flag != value))
+            flag[selected] = value
@@ -0,0 +1,307 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # No peak memory figures where the resource module is missing (Windows)
+    resource = None
+
+# Headless unless a video driver was asked for
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from maze_generator import maze_rows, write_maze_binary
+from simulation import TILE_SIZE, MazeSimulation
+from solver import GridSolver, player_tile
+
+SIZES = (55, 256, 1024, 4096)
+# 55 is the shipped map, the other sizes are mazes generated once into this directory
+BENCHMARK_MAPS = 'benchmark_maps'
+BENCHMARK_SEED = 1
+# Figures from the machine it was saved on, so it is not committed: save one with --save before a change
+BASELINE_FILE = 'benchmark_baseline.json'
+# Each measurement repeats the operation until it takes this long, and the best of REPEATS counts
+MIN_TIME = 0.2
+REPEATS = 3
+# An operation slower than this is only measured once
+SLOW_OPERATION = 1.0
+# Fewer ops/sec than the baseline by more than this fraction is a regression
+TOLERANCE = 0.2
+
+# name -> (setup(size) returning run(count), largest map side it is run on)
+BENCHMARKS = {}
+
+
+def benchmark(name, max_size=None):
+    def register(setup):
+        BENCHMARKS[name] = (setup, max_size)
+        return setup
+    return register
+
+
+def map_file(size):
+    if size == 55:
+        return None
+    path = os.path.join(BENCHMARK_MAPS, f"maze_{size}_{BENCHMARK_SEED}.mazec")
+    if not os.path.exists(path):
+        os.makedirs(BENCHMARK_MAPS, exist_ok=True)
+        write_maze_binary(path, size, size, seed=BENCHMARK_SEED)
+    return path
+
+
+def simulation_for(size, cls=MazeSimulation):
+    return cls(map_file(size))
+
+
+def random_tiles(simulation, count, seed=BENCHMARK_SEED):
+    rng = random.Random(seed)
+    return [(rng.randrange(simulation.map_width), rng.randrange(simulation.map_height)) for _ in range(count)]
+
+
+@benchmark('generate')
+def bench_generate(size):
+    def run(count):
+        for _ in range(count):
+            for _ in maze_rows(size, size, 'eller', BENCHMARK_SEED):
+                pass
+    return run
+
+
+@benchmark('load_csv', max_size=1024)
+def bench_load_csv(size):
+    simulation = simulation_for(size)
+    path = os.path.join(tempfile.mkdtemp(), f"maze_{size}.csv")
+    with open(path, 'w', newline='') as csv_file:
+        csv.writer(csv_file).writerows(simulation.map_layout.rows())
+
+    def run(count):
+        for _ in range(count):
+            simulation.load_map_from_csv(path)
+    return run
+
+
+@benchmark('wall_rects', max_size=1024)
+def bench_wall_rects(size):
+    simulation = simulation_for(size)
+
+    def run(count):
+        for _ in range(count):
+            simulation.get_wall_rects()
+    return run
+
+
+@benchmark('update_map')
+def bench_update_map(size):
+    simulation = simulation_for(size)
+    tiles = random_tiles(simulation, 1024)
+
+    def run(count):
+        for index in range(count):
+            x, y = tiles[index % len(tiles)]
+            # Walls one round, paths the next, so every write changes tiles
+            simulation.update_map(x, y, x + 2, y + 2, index // len(tiles) % 2)
+    return run
+
+
+@benchmark('map_logic')
+def bench_map_logic(size):
+    # The player walks a pixel a step across every trigger zone, from the tile before it to the tile after,
+    # so zones are entered and left and their actions fire as in play
+    simulation = simulation_for(size)
+    path = []
+    for zone in simulation.triggers.zones:
+        start_x, start_y, end_x, _ = zone.area
+        path += [(x, start_y * TILE_SIZE) for x in range((start_x - 1) * TILE_SIZE, (end_x + 2) * TILE_SIZE)]
+
+    def run(count):
+        for index in range(count):
+            simulation.player_rect.topleft = path[index % len(path)]
+            simulation.map_logic()
+    return run
+
+
+@benchmark('collision')
+def bench_collision(size):
+    # What movement_controller does each tick for the keys it reads
+    simulation = simulation_for(size)
+    rng = random.Random(BENCHMARK_SEED)
+    actions = [rng.randrange(16) for _ in range(4096)]
+
+    def run(count):
+        for index in range(count):
+            if simulation.done:
+                simulation.restart_game()
+            simulation.step(actions[index % len(actions)])
+    return run
+
+
+@benchmark('draw_map')
+def bench_draw_map(size):
+    from main import MazeGame
+    game = simulation_for(size, MazeGame)
+    positions = [(x * TILE_SIZE, y * TILE_SIZE) for x, y in random_tiles(game, 64)]
+
+    def run(count):
+        for index in range(count):
+            # A new spot every 16 frames: mostly dirty rect frames, some full redraws after a jump
+            if index % 16 == 0:
+                game.player_rect.topleft = positions[index // 16 % len(positions)]
+            else:
+                game.player_rect.move_ip(1, 0)
+            game.interpolate(1.0)
+            game.update_camera()
+            if game.full_redraw:
+                game.screen.fill((255, 255, 255))
+            game.draw_map()
+            game.draw_player()
+            game.present()
+    return run
+
+
+@benchmark('solve', max_size=1024)
+def bench_solve(size):
+    simulation = simulation_for(size)
+    solver = GridSolver.from_simulation(simulation)
+    start = player_tile(simulation.player_rect)
+    index = solver.walls.rfind(0)
+    goal = (index % solver.width, index // solver.width)
+
+    def run(count):
+        for _ in range(count):
+            solver.astar(start, goal)
+    return run
+
+
+def measure(run):
+    """Best ops/sec of REPEATS timings, each running the operation at least MIN_TIME."""
+    count, best = 1, 0.0
+    repeats = REPEATS
+    while repeats:
+        start = time.perf_counter()
+        run(count)
+        elapsed = time.perf_counter() - start
+        if elapsed < MIN_TIME:
+            count = max(count * 2, int(count * MIN_TIME * 1.2 / max(elapsed, 1e-9)))
+            continue
+        best = max(best, count / elapsed)
+        repeats = 0 if elapsed / count > SLOW_OPERATION else repeats - 1
+    return best
+
+
+def peak_resident():
+    """The process's peak resident size in bytes."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes, except on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_resident():
+    # Linux lets a process restart its high water mark from its current size; elsewhere the
+    # peak of starting up the process may hide a smaller benchmark's
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def memory_worker(name, size):
+    reset_peak_resident()
+    before = peak_resident()
+    BENCHMARKS[name][0](size)(1)
+    return peak_resident() - before
+
+
+def peak_memory(runs):
+    """How far setting each benchmark up and running its operation once raises the peak resident size.
+
+    Every run gets a fresh process, so earlier benchmarks do not hide it, and nothing is traced, so
+    pygame's surfaces count too and slow operations are not slowed down further.
+    """
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        return [pool.apply(memory_worker, run) for run in runs]
+
+
+def run_benchmarks(names, sizes, memory=True):
+    runs = [(name, size) for name in names for size in sizes
+            if BENCHMARKS[name][1] is None or size <= BENCHMARKS[name][1]]
+    results = {}
+    for name, size in runs:
+        ops = measure(BENCHMARKS[name][0](size))
+        results[f"{name}/{size}"] = {'ops_per_sec': ops}
+        print(f"{name + '/' + str(size):<20}{ops:14.1f} ops/s", flush=True)
+    # After all the timings, so starting the worker processes does not take CPU from them
+    if memory and resource is not None:
+        print("\npeak memory")
+        for (name, size), peak in zip(runs, peak_memory(runs)):
+            results[f"{name}/{size}"]['peak_bytes'] = peak
+            print(f"{name + '/' + str(size):<20}{peak / 1e6:14.2f} MB", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Print each result against the baseline and return the keys that got slower than tolerance allows."""
+    regressions = []
+    print(f"\n{'benchmark':<20}{'baseline':>14}{'now':>14}{'change':>9}")
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:<20}{'-':>14}{result['ops_per_sec']:14.1f}{'new':>9}")
+            continue
+        before = baseline[key]['ops_per_sec']
+        change = result['ops_per_sec'] / before - 1 if before else 0.0
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{key:<20}{before:14.1f}{result['ops_per_sec']:14.1f}{change:+9.1%}"
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine's hot paths against a stored baseline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory runs")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.sizes, memory=not args.no_memory)
+    pygame.quit()
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        # Benchmarks that were not run keep their old baseline
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+        print(f"\nbaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
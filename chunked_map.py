@@ -0,0 +1,211 @@
+from collections import OrderedDict
+
+# Chunks are square blocks of tiles, loaded and dropped as a whole
+CHUNK_SIZE = 64
+# Unmodified chunks kept in memory per map, about 8 KB each with their wall mask
+MAX_CHUNKS = 256
+
+WALL_TABLE = bytes(1 if value == 0 else 0 for value in range(256))
+
+
+class ChunkStore:
+    """The unmodified chunks of a row-major tile buffer, read from it on demand and dropped LRU.
+
+    The buffer is usually a memory-mapped compiled map, so only the pages of the chunks that
+    are asked for are ever read from disk. Each entry is [tiles, wall mask or None], both
+    chunk_size x chunk_size bytes; tiles past the map edge are walls that nothing reads.
+    """
+
+    def __init__(self, source, width, height, chunk_size=CHUNK_SIZE, max_chunks=MAX_CHUNKS):
+        if len(source) < width * height:
+            raise ValueError(f"Expected {width * height} tiles, got {len(source)}")
+        self.source = source
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+
+    def load(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        entry = self.chunks.get(key)
+        if entry is not None:
+            self.chunks.move_to_end(key)
+            return entry
+        size = self.chunk_size
+        tiles = bytearray(size * size)
+        start_x = chunk_x * size
+        span = min(size, self.width - start_x)
+        for row in range(min(size, self.height - chunk_y * size)):
+            offset = (chunk_y * size + row) * self.width + start_x
+            tiles[row * size:row * size + span] = self.source[offset:offset + span]
+        entry = self.chunks[key] = [tiles, None]
+        self.loads += 1
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+
+class ChunkedTileGrid:
+    """A TileGrid look-alike over a ChunkStore, for maps too big to hold in memory.
+
+    Reads go through the store. A chunk that is written is copied out of it first and kept
+    by this grid until it is dropped, so copies of the grid share the unmodified chunks and
+    memory grows with the chunks the game actually changed, not with the map.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.width = store.width
+        self.height = store.height
+        self.chunk_size = store.chunk_size
+        self.modified = {}
+
+    def chunk(self, chunk_x, chunk_y):
+        return self.modified.get((chunk_x, chunk_y)) or self.store.load(chunk_x, chunk_y)
+
+    def writable_chunk(self, chunk_x, chunk_y):
+        entry = self.modified.get((chunk_x, chunk_y))
+        if entry is None:
+            tiles = self.store.load(chunk_x, chunk_y)[0]
+            entry = self.modified[chunk_x, chunk_y] = [bytearray(tiles), None]
+        return entry
+
+    def chunk_mask(self, chunk_x, chunk_y):
+        """The chunk's wall mask, built from its tiles the first time it is needed."""
+        entry = self.chunk(chunk_x, chunk_y)
+        if entry[1] is None:
+            entry[1] = entry[0].translate(WALL_TABLE)
+        return entry[1]
+
+    def chunks_in(self, start_x, start_y, end_x, end_y):
+        """Yield (chunk_x, chunk_y) of every chunk the tile rectangle (inclusive corners) touches."""
+        size = self.chunk_size
+        start_x, end_x = max(start_x, 0), min(end_x, self.width - 1)
+        start_y, end_y = max(start_y, 0), min(end_y, self.height - 1)
+        for chunk_y in range(start_y // size, end_y // size + 1):
+            for chunk_x in range(start_x // size, end_x // size + 1):
+                yield chunk_x, chunk_y
+
+    def preload(self, start_x, start_y, end_x, end_y):
+        """Load the chunks under a tile rectangle (inclusive corners), e.g. around the camera."""
+        for chunk_x, chunk_y in self.chunks_in(start_x, start_y, end_x, end_y):
+            self.chunk(chunk_x, chunk_y)
+
+    def __getitem__(self, position):
+        x, y = position
+        size = self.chunk_size
+        return self.chunk(x // size, y // size)[0][y % size * size + x % size]
+
+    def __setitem__(self, position, value):
+        x, y = position
+        size = self.chunk_size
+        entry = self.writable_chunk(x // size, y // size)
+        entry[0][y % size * size + x % size] = value
+        entry[1] = None
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def row(self, y, start_x=0, end_x=None):
+        """The tiles of row y, or of its [start_x, end_x) part, read from just the chunks it crosses."""
+        size = self.chunk_size
+        end_x = self.width if end_x is None else end_x
+        if start_x >= end_x:
+            return b''
+        offset = y % size * size
+        first_chunk = start_x // size
+        tiles = b''.join(bytes(self.chunk(chunk_x, y // size)[0][offset:offset + size])
+                         for chunk_x in range(first_chunk, (end_x - 1) // size + 1))
+        return tiles[start_x - first_chunk * size:end_x - first_chunk * size]
+
+    def rows(self):
+        return [list(self.row(y)) for y in range(self.height)]
+
+    def copy(self):
+        grid = ChunkedTileGrid(self.store)
+        grid.modified = {key: [bytearray(tiles), None] for key, (tiles, mask) in self.modified.items()}
+        return grid
+
+    def fill_rect(self, start_x, start_y, end_x, end_y, value):
+        """Set every tile of the rectangle (clipped to the grid) and return the positions that changed."""
+        start_x, end_x = max(start_x, 0), min(end_x, self.width - 1)
+        start_y, end_y = max(start_y, 0), min(end_y, self.height - 1)
+        changed = []
+        for y in range(start_y, end_y + 1):
+            for x in range(start_x, end_x + 1):
+                if self[x, y] != value:
+                    self[x, y] = value
+                    changed.append((x, y))
+        return changed
+
+    def mask(self, *values):
+        """One byte per tile, 1 where the tile holds one of values; this reads the whole map."""
+        table = bytearray(256)
+        for value in values:
+            table[value] = 1
+        return b''.join(self.row(y).translate(table) for y in range(self.height))
+
+    def positions(self, value):
+        """Yield (x, y) of every tile holding value; this reads the whole map."""
+        for y in range(self.height):
+            row = self.row(y)
+            x = row.find(value)
+            while x != -1:
+                yield x, y
+                x = row.find(value, x + 1)
+
+    def wall_mask(self):
+        return ChunkedWallMask(self)
+
+
+class ChunkedWallMask:
+    """The flat, row-major wall mask MazeSimulation collides against, answered from per-chunk masks."""
+
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __len__(self):
+        return self.grid.width * self.grid.height
+
+    def __getitem__(self, index):
+        y, x = divmod(index, self.grid.width)
+        size = self.grid.chunk_size
+        return self.grid.chunk_mask(x // size, y // size)[y % size * size + x % size]
+
+    def __setitem__(self, index, value):
+        # Tile writes already drop the chunk's mask, so it is rebuilt from the tiles when next needed
+        pass
+
+    def find(self, value, start, end):
+        """Like bytearray.find, for a start:end slice that stays within one row."""
+        grid = self.grid
+        size = grid.chunk_size
+        y, first_x = divmod(start, grid.width)
+        last_x = first_x + end - start - 1
+        offset = y % size * size
+        for chunk_x in range(first_x // size, last_x // size + 1):
+            mask = grid.chunk_mask(chunk_x, y // size)
+            left = chunk_x * size
+            found = mask.find(value, offset + max(first_x - left, 0), offset + min(last_x - left, size - 1) + 1)
+            if found != -1:
+                return y * grid.width + left + found - offset
+        return -1
+
+    def rfind(self, value, start, end):
+        """Like bytearray.rfind, for a start:end slice that stays within one row."""
+        grid = self.grid
+        size = grid.chunk_size
+        y, first_x = divmod(start, grid.width)
+        last_x = first_x + end - start - 1
+        offset = y % size * size
+        for chunk_x in range(last_x // size, first_x // size - 1, -1):
+            mask = grid.chunk_mask(chunk_x, y // size)
+            left = chunk_x * size
+            found = mask.rfind(value, offset + max(first_x - left, 0), offset + min(last_x - left, size - 1) + 1)
+            if found != -1:
+                return y * grid.width + left + found - offset
+        return -1
@@ -1,22 +1,102 @@
+import argparse
+import time
+from collections import OrderedDict
+
 import pygame
-import pygame.math as math
-import csv
+from chunked_map import CHUNK_SIZE
+from profiler import FrameProfiler
+from recording import InputRecorder, Recording
+from simulation import (BASE_IMG_PATH, WIDTH, HEIGHT, TILE_SIZE,
+                        LEFT, RIGHT, UP, DOWN, MazeSimulation)
+from texture_atlas import load_atlas
 
 # Constants
-BASE_IMG_PATH = 'Assets/'
-WIDTH, HEIGHT = 660, 660
+# Rendered frames per second at most, 0 for uncapped; the game itself runs at TICK_RATE whatever this is
 FPS = 60
-CHARACTER_SPEED = 4
-TILE_SIZE = 12
+VSYNC = False
+# Simulation steps per second, so the player moves CHARACTER_SPEED * TICK_RATE pixels a second
+TICK_RATE = 60
+TICK_TIME = 1 / TICK_RATE
+# Time the simulation may fall behind before it stops catching up, e.g. while the window is dragged
+MAX_LAG = 0.25
+# With no key held and nothing changing, sleep on the event queue instead of drawing identical frames
+EVENT_DRIVEN = True
+# Milliseconds a sleep lasts at most before the held keys are looked at again
+IDLE_TIMEOUT = 1000
 FONT_SIZE = 36
 TEXT_COLOR = (0, 0, 0) 
 LINE_SPACING = 5
+USE_DIRTY_RECTS = True
+TEXT_CACHE_ENTRIES = 64
+TEXT_CACHE_BYTES = 4 * 1024 * 1024
+# Pre-drawn map chunks kept for the view to copy from, 64x64 tiles at 12 pixels are about 2.3 MB each
+CHUNK_SURFACES = 16
+# Trapped as soon as the exit is out of reach, not only in the map's own trap zones
+DETECT_TRAPS = False
+# Tiles around the view whose map chunks are loaded before the camera gets to them
+PRELOAD_MARGIN = CHUNK_SIZE // 2
+# F3 shows the frame profile, F4 writes its trace next to the game as CSV and JSON
+PROFILE_KEY = pygame.K_F3
+PROFILE_DUMP_KEY = pygame.K_F4
+PROFILE_TRACE = 'frame_profile'
+PROFILE_FONT_SIZE = 20
+PROFILE_REFRESH = 0.5
+# Game methods timed by the profiler, and the phase each one is reported under
+PROFILE_PHASES = {
+    'handle_events': 'events',
+    'movement_controller': 'movement',
+    'map_logic': 'map_logic',
+    'update_map': 'update_map',
+    'commit_map_updates': 'wall_index',
+    'update_camera': 'camera',
+    'draw_map': 'draw_map',
+    'display_messages': 'messages',
+    'present': 'flip',
+}
+IMAGES = {
+    'player': 'Box.png',
+    'wall': 'wall.jpg',
+    'grass': 'grass.jpg',
+    'ground': 'ground.png',
+    'finish': 'finish.png'
+}
+
+class TextCache:
+    """Rendered text surfaces keyed by (text, font, color, antialias), least recently used dropped first."""
+
+    def __init__(self, max_entries=TEXT_CACHE_ENTRIES, max_bytes=TEXT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color):
+        key = (text, font, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        self.size_bytes += self.surface_bytes(surface)
+        while self.surfaces and (len(self.surfaces) > self.max_entries or self.size_bytes > self.max_bytes):
+            _, evicted = self.surfaces.popitem(last=False)
+            self.size_bytes -= self.surface_bytes(evicted)
+        return surface
 
-class Utils:
     @staticmethod
-    def load_image(filename):
-        return pygame.image.load(BASE_IMG_PATH + filename)
-    
+    def surface_bytes(surface):
+        return surface.get_pitch() * surface.get_height()
+
+# Shared by every message and button, so a line of text is rendered once while it stays on screen
+text_cache = TextCache()
+# Off until toggled; the drawing code reports its blits and Rects to it
+profiler = FrameProfiler()
+
 class Button:
     def __init__(self, text, font, color, x, y, width, height):
         self.font = font
@@ -26,360 +106,441 @@ class Button:
         self._update_surface()
 
     def _update_surface(self):
-        self.surface = self.font.render(self.text, True, self.color)
+        self.surface = text_cache.render(self.font, self.text, True, self.color)
         self.text_rect = self.surface.get_rect(center=self.rect.center)
     
     def draw(self, screen):
         pygame.draw.rect(screen, (200, 200, 200), self.rect)  # Button background
         screen.blit(self.surface, self.text_rect)  # Button text
+        profiler.count('blits')
     
     def is_clicked(self, mouse_pos):
         return self.rect.collidepoint(mouse_pos)
 
-class MazeGame:
-    def __init__(self):
+def action_from_keys(keys):
+    return ((LEFT if keys[pygame.K_LEFT] else 0) | (RIGHT if keys[pygame.K_RIGHT] else 0) |
+            (UP if keys[pygame.K_UP] else 0) | (DOWN if keys[pygame.K_DOWN] else 0))
+
+class MazeGame(MazeSimulation):
+    def __init__(self, map_file=None, record_path=None, detect_traps=DETECT_TRAPS):
         pygame.init()
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE)
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE, vsync=1 if VSYNC else 0)
         self.clock = pygame.time.Clock()
         self.running = True
-        self.reset_flags()
+        self.dirty_tiles = set()
+        self.dirty_rects = []
+        self.overlay_rects = []
+        self.previous_overlay_rects = []
+        # With a record path every tick's input is kept and written there when the game closes
+        self.record_path = record_path
+        self.recorder = InputRecorder() if record_path else None
+        self.chunk_surfaces = OrderedDict()
+        self.background_appearance = None
+        # Set by a tick that had nothing to do, so the ticks after it can't change anything either
+        self.settled = False
+        self.tiles_changed = False
         
         # Load and scale images
         self.load_assets()
 
-        # Initialize player and map
-        self.initialize_player()
-        self.initialize_map()
+        # Initialize flags, player and map
+        super().__init__(map_file, detect_traps=detect_traps)
         
         # Initialize message display and restart button
         self.font = pygame.font.SysFont(None, FONT_SIZE)
-        self.restart_button = Button("Restart", self.font, (0, 0, 0), WIDTH // 2 - 50, HEIGHT // 2 + 50, 90, 40)
+        screen_width, screen_height = self.screen.get_size()
+        self.restart_button = Button("Restart", self.font, (0, 0, 0),
+                                     screen_width // 2 - 50, screen_height // 2 + 50, 90, 40)
+
+        profiler.attach(self, PROFILE_PHASES)
+        self.profile_font = pygame.font.SysFont(None, PROFILE_FONT_SIZE)
+        self.profile_lines = []
+        self.profile_shown_at = 0.0
 
     def load_assets(self):
-        self.assets = {
-            'player': Utils.load_image('Box.png'),
-            'wall': Utils.load_image('wall.jpg'),
-            'grass': Utils.load_image('grass.jpg'),
-            'ground': Utils.load_image('ground.png'),
-            'finish': Utils.load_image('finish.png')
-        }
-        self.player_image = pygame.transform.scale(self.assets['player'], (TILE_SIZE, TILE_SIZE))
-        self.wall_image = pygame.transform.scale(self.assets['wall'], (TILE_SIZE, TILE_SIZE))
-        self.grass_image = pygame.transform.scale(self.assets['grass'], (TILE_SIZE, TILE_SIZE))
-        self.ground_image = pygame.transform.scale(self.assets['ground'], (TILE_SIZE, TILE_SIZE))
-        self.finish_image = pygame.transform.scale(self.assets['finish'], (TILE_SIZE, TILE_SIZE))
-
-    def get_wall_rects(self):
-        return [pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                for y, row in enumerate(self.map_creation)
-                for x, tile in enumerate(row)
-                if tile == 0]
-
-    def load_map_from_csv(self, filename):
-        with open(filename, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            return [[int(tile) for tile in row] for row in reader]
+        # Decoded, scaled and converted to the display format once; the scaled atlas is kept on disk
+        self.atlas = load_atlas({name: BASE_IMG_PATH + filename for name, filename in IMAGES.items()}, TILE_SIZE)
+        self.player_image = self.atlas.image('player')
+        self.wall_image = self.atlas.image('wall')
+        self.grass_image = self.atlas.image('grass')
+        self.ground_image = self.atlas.image('ground')
+        self.finish_image = self.atlas.image('finish')
+
+    def tile_image(self, tile):
+        if tile == 0:
+            return self.wall_image
+        if tile == 2 and self.is_eligible and self.exit_clue == [True, True, True]:
+            return self.finish_image
+        if tile == 3 and self.is_eligible:
+            return self.ground_image
+        return self.grass_image
+
+    def tile_appearance(self):
+        # Tiles 2 and 3 change their look with these flags, not with their value
+        return (self.is_eligible, self.exit_clue == [True, True, True])
 
-    def draw_map(self):
-        for y, row in enumerate(self.map_creation):
-            for x, tile in enumerate(row):
-                if tile == 0:
-                    self.screen.blit(self.wall_image, (x * TILE_SIZE, y * TILE_SIZE))
-                if tile == 1:
-                    self.screen.blit(self.grass_image, (x * TILE_SIZE, y * TILE_SIZE))
-                if tile == 2:
-                    if self.is_eligible:
-                        if self.exit_clue == [True, True, True]:
-                            self.screen.blit(self.finish_image, (x * TILE_SIZE, y * TILE_SIZE))
-                        else:
-                            self.screen.blit(self.grass_image, (x * TILE_SIZE, y * TILE_SIZE))
-                    else:
-                        self.screen.blit(self.grass_image, (x * TILE_SIZE, y * TILE_SIZE))
-                if tile == 3:
-                    if self.is_eligible:
-                        self.screen.blit(self.ground_image, (x * TILE_SIZE, y * TILE_SIZE))
-                    else:
-                        self.screen.blit(self.grass_image, (x * TILE_SIZE, y * TILE_SIZE))
+    def initialize_player(self):
+        super().initialize_player()
+        # Where the player was before the last tick, and where it is drawn in between ticks
+        self.previous_position = self.player_rect.topleft
+        self.draw_rect = self.player_rect.copy()
+
+    def interpolate(self, alpha):
+        """Put the drawn player alpha of the way from its position before the last tick to its current one."""
+        (x, y), (current_x, current_y) = self.previous_position, self.player_rect.topleft
+        self.draw_rect.topleft = (round(x + (current_x - x) * alpha), round(y + (current_y - y) * alpha))
+
+    def camera_rect(self):
+        """The window's view of the map, centered on the drawn player but never past the map edges.
+
+        A map smaller than the window stays in the top left corner.
+        """
+        screen_width, screen_height = self.screen.get_size()
+        x = max(0, min(self.draw_rect.centerx - screen_width // 2, self.map_width * TILE_SIZE - screen_width))
+        y = max(0, min(self.draw_rect.centery - screen_height // 2, self.map_height * TILE_SIZE - screen_height))
+        return pygame.Rect(x, y, screen_width, screen_height)
+
+    def update_camera(self):
+        camera = self.camera_rect()
+        if camera.size != self.camera.size:
+            # A resized window only changes how much of the map is in view
+            self.restart_button.rect.topleft = (camera.width // 2 - 50, camera.height // 2 + 50)
+            self.restart_button._update_surface()
+            self.build_background()
+        elif camera.topleft != self.camera.topleft:
+            self.camera = camera
+            self.full_redraw = True
+            self.preload_chunks()
+
+    def preload_chunks(self):
+        # A big map's chunks are read from disk while they are still a margin away from the view
+        start_x, start_y = self.camera.x // TILE_SIZE - PRELOAD_MARGIN, self.camera.y // TILE_SIZE - PRELOAD_MARGIN
+        self.map_creation.preload(start_x, start_y, (self.camera.right - 1) // TILE_SIZE + PRELOAD_MARGIN,
+                                  (self.camera.bottom - 1) // TILE_SIZE + PRELOAD_MARGIN)
+
+    def view_origin(self):
+        # The top left tile of the view, moved back where the margin would run off the map
+        return (min(self.camera.x // TILE_SIZE, self.map_width - self.view_columns),
+                min(self.camera.y // TILE_SIZE, self.map_height - self.view_rows))
+
+    def build_background(self):
+        # Only the tiles under the camera, plus a margin for partly visible ones, are kept in a surface
+        self.camera = self.camera_rect()
+        self.preload_chunks()
+        self.view_columns = min(self.camera.width // TILE_SIZE + 2, self.map_width)
+        self.view_rows = min(self.camera.height // TILE_SIZE + 2, self.map_height)
+        self.background = pygame.Surface((self.view_columns * TILE_SIZE, self.view_rows * TILE_SIZE)).convert()
+        self.background_origin = self.view_origin()
+        # Chunks drawn before a resize are kept, brought up to date with what changed since
+        if self.tile_appearance() != self.background_appearance:
+            self.chunk_surfaces.clear()
+        for x, y in self.dirty_tiles:
+            self.redraw_chunk_tile(x, y)
+        self.draw_tiles(self.background_origin[0], self.background_origin[1],
+                        self.background_origin[0] + self.view_columns, self.background_origin[1] + self.view_rows)
+        self.background_appearance = self.tile_appearance()
+        self.dirty_tiles.clear()
+        self.full_redraw = True
+
+    def chunk_surface(self, chunk_x, chunk_y):
+        """The tiles of one map chunk drawn once, then kept until they change or the chunk is least recently used."""
+        key = (chunk_x, chunk_y)
+        surface = self.chunk_surfaces.get(key)
+        if surface is not None:
+            self.chunk_surfaces.move_to_end(key)
+            return surface
+        surface = pygame.Surface((CHUNK_SIZE * TILE_SIZE, CHUNK_SIZE * TILE_SIZE)).convert()
+        surface.fill((255, 255, 255))
+        start_x, start_y = chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE
+        end_x = min(start_x + CHUNK_SIZE, self.map_width)
+        for y in range(start_y, min(start_y + CHUNK_SIZE, self.map_height)):
+            for x, tile in enumerate(self.map_creation.row(y, start_x, end_x), start_x):
+                surface.blit(self.tile_image(tile), ((x - start_x) * TILE_SIZE, (y - start_y) * TILE_SIZE))
+        profiler.count('blits', (end_x - start_x) * (min(start_y + CHUNK_SIZE, self.map_height) - start_y))
+        profiler.count('chunks_drawn')
+        self.chunk_surfaces[key] = surface
+        if len(self.chunk_surfaces) > CHUNK_SURFACES:
+            self.chunk_surfaces.popitem(last=False)
+        return surface
+
+    def redraw_chunk_tile(self, x, y):
+        # A changed tile is patched into its chunk's surface, if that chunk is drawn at all
+        surface = self.chunk_surfaces.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if surface is not None:
+            position = (x % CHUNK_SIZE * TILE_SIZE, y % CHUNK_SIZE * TILE_SIZE)
+            surface.fill((255, 255, 255), (position, (TILE_SIZE, TILE_SIZE)))
+            surface.blit(self.tile_image(self.map_creation[x, y]), position)
+            profiler.count('blits')
+
+    def draw_tiles(self, start_x, start_y, end_x, end_y):
+        """Copy map tiles [start_x, end_x) x [start_y, end_y) from their chunks onto the background."""
+        origin_x, origin_y = self.background_origin
+        for chunk_y in range(start_y // CHUNK_SIZE, (end_y - 1) // CHUNK_SIZE + 1):
+            top, bottom = max(start_y, chunk_y * CHUNK_SIZE), min(end_y, (chunk_y + 1) * CHUNK_SIZE)
+            for chunk_x in range(start_x // CHUNK_SIZE, (end_x - 1) // CHUNK_SIZE + 1):
+                left, right = max(start_x, chunk_x * CHUNK_SIZE), min(end_x, (chunk_x + 1) * CHUNK_SIZE)
+                area = pygame.Rect((left - chunk_x * CHUNK_SIZE) * TILE_SIZE, (top - chunk_y * CHUNK_SIZE) * TILE_SIZE,
+                                   (right - left) * TILE_SIZE, (bottom - top) * TILE_SIZE)
+                self.background.blit(self.chunk_surface(chunk_x, chunk_y),
+                                     ((left - origin_x) * TILE_SIZE, (top - origin_y) * TILE_SIZE), area)
+                profiler.count('blits')
+                profiler.count('rects')
+
+    def scroll_background(self, origin):
+        # Shift what is already drawn and draw only the tiles that scrolled into view
+        shift_x, shift_y = origin[0] - self.background_origin[0], origin[1] - self.background_origin[1]
+        self.background_origin = origin
+        origin_x, origin_y = origin
+        end_x, end_y = origin_x + self.view_columns, origin_y + self.view_rows
+        if abs(shift_x) >= self.view_columns or abs(shift_y) >= self.view_rows:
+            self.draw_tiles(origin_x, origin_y, end_x, end_y)
+            return
+        self.background.scroll(-shift_x * TILE_SIZE, -shift_y * TILE_SIZE)
+        if shift_x > 0:
+            self.draw_tiles(end_x - shift_x, origin_y, end_x, end_y)
+        elif shift_x < 0:
+            self.draw_tiles(origin_x, origin_y, origin_x - shift_x, end_y)
+        if shift_y > 0:
+            self.draw_tiles(origin_x, end_y - shift_y, end_x, end_y)
+        elif shift_y < 0:
+            self.draw_tiles(origin_x, origin_y, end_x, origin_y - shift_y)
+
+    def background_position(self):
+        # Where the background's top left corner lands on the screen
+        return (self.background_origin[0] * TILE_SIZE - self.camera.x,
+                self.background_origin[1] * TILE_SIZE - self.camera.y)
+
+    def refresh_background(self):
+        origin = self.view_origin()
+        if origin != self.background_origin:
+            self.scroll_background(origin)
+        origin_x, origin_y = self.background_origin
+        appearance = self.tile_appearance()
+        if appearance != self.background_appearance:
+            # Every drawn chunk may show tiles 2 and 3 the old way, so they are all drawn again
+            self.background_appearance = appearance
+            self.chunk_surfaces.clear()
+            self.draw_tiles(origin_x, origin_y, origin_x + self.view_columns, origin_y + self.view_rows)
+            self.full_redraw = True
+        screen_x, screen_y = self.background_position()
+        for x, y in self.dirty_tiles:
+            self.redraw_chunk_tile(x, y)
+            # Tiles out of view are drawn from their chunk when they scroll in
+            if origin_x <= x < origin_x + self.view_columns and origin_y <= y < origin_y + self.view_rows:
+                self.draw_tiles(x, y, x + 1, y + 1)
+                tile_rect = pygame.Rect((x - origin_x) * TILE_SIZE, (y - origin_y) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                self.dirty_rects.append(tile_rect.move(screen_x, screen_y))
+                profiler.count('rects', 2)
+        self.dirty_tiles.clear()
 
+    def draw_map(self):
+        self.refresh_background()
+        # Last frame's messages and button can reach past the background when the window is bigger than the map
+        for rect in self.previous_overlay_rects:
+            self.screen.fill((255, 255, 255), rect)
+        self.screen.blit(self.background, self.background_position())
+        profiler.count('blits')
         self.display_messages()
 
+    def draw_player(self):
+        player_rect = self.draw_rect.move(-self.camera.x, -self.camera.y)
+        self.screen.blit(self.player_image, player_rect)
+        self.overlay_rects.append(player_rect)
+        profiler.count('blits')
+        profiler.count('rects')
+
+    def draw_profile(self):
+        # The numbers only change twice a second, so the text cache keeps the rendered lines meanwhile
+        now = time.perf_counter()
+        if now - self.profile_shown_at >= PROFILE_REFRESH:
+            self.profile_lines = profiler.overlay_lines()
+            self.profile_shown_at = now
+        y = 0
+        for line in self.profile_lines:
+            line_surface = text_cache.render(self.profile_font, line, True, TEXT_COLOR)
+            line_rect = self.screen.fill((255, 255, 255), line_surface.get_rect(topleft=(0, y)))
+            self.screen.blit(line_surface, line_rect)
+            self.overlay_rects.append(line_rect)
+            y += line_rect.height
+
     def display_messages(self):
         if self.reach_center:
             self.show_msg("You've reached the center area!\nNow find the true exit!")
         if self.is_trapped:
             self.show_msg("You're trapped. Restart the game!")
             self.button_visible = True
-            self.restart_button.draw(self.screen)
+            self.draw_restart_button()
         if self.instantDeath:
             self.show_msg("You stepped on something you shouldn't have.\nRestart the game!")
             self.button_visible = True
-            self.restart_button.draw(self.screen)
+            self.draw_restart_button()
         if self.noEntry:
             self.show_msg("You are not eligible to enter")
         if self.game_over:
             self.show_msg("Congratulation!\nNew Game")
             self.button_visible = True
-            self.restart_button.draw(self.screen)
-
-    def update_map(self, start_x, start_y, end_x, end_y, new_value):
-        for y in range(start_y, end_y + 1):
-            for x in range(start_x, end_x + 1):
-                if 0 <= y < len(self.map_creation) and 0 <= x < len(self.map_creation[y]):
-                    self.map_creation[y][x] = new_value
-        self.wall_rects = self.get_wall_rects()
-
-    def movement_controller(self):
-        if self.is_trapped or self.instantDeath or self.game_over:
-            return
-
-        keys = pygame.key.get_pressed()
-        direction = math.Vector2(
-            (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]),
-            (keys[pygame.K_DOWN] - keys[pygame.K_UP])
-        )
-
-        if direction.length() > 0:
-            direction.normalize_ip()
-        
-        movement = direction * CHARACTER_SPEED
-        new_player_rect = self.player_rect.move(movement.x, movement.y)
-
-        if not any(new_player_rect.colliderect(wall_rect) for wall_rect in self.wall_rects):
-            self.player_rect.move_ip(movement.x, movement.y)
-
-        self.player_rect.x = max(0, min(self.player_rect.x, WIDTH - self.player_rect.width))
-        self.player_rect.y = max(0, min(self.player_rect.y, HEIGHT - self.player_rect.height))
-
-        self.map_logic()
-
-    def map_logic(self):
-        tile_x = self.player_rect.x // TILE_SIZE
-        tile_y = self.player_rect.y // TILE_SIZE
-
-        rects = {
-            'fullMap': pygame.Rect(1 * TILE_SIZE, 1 * TILE_SIZE, (53 - 1 + 1) * TILE_SIZE, (51 - 1 + 1) * TILE_SIZE),
-            'trueExit': pygame.Rect(1 * TILE_SIZE, 15 * TILE_SIZE, (3 - 1 + 1) * TILE_SIZE, (20 - 15 + 1) * TILE_SIZE),
-            'centerRectWall1': pygame.Rect(30 * TILE_SIZE, 18 * TILE_SIZE, (33 - 30 + 1) * TILE_SIZE, (21 - 18 + 1) * TILE_SIZE),
-            'centerRectWall2': pygame.Rect(28 * TILE_SIZE, 16 * TILE_SIZE, (35 - 28 + 1) * TILE_SIZE, (22 - 16 + 1) * TILE_SIZE),
-            'upperTunnelWall': pygame.Rect(30 * TILE_SIZE, 10 * TILE_SIZE, (32 - 30 + 1) * TILE_SIZE, (14 - 10 + 1) * TILE_SIZE),
-            'bottomTunnelWall': pygame.Rect(31 * TILE_SIZE, 25 * TILE_SIZE, (32 - 31 + 1) * TILE_SIZE, (28 - 25 + 1) * TILE_SIZE),
-            'leftTunnelWall': pygame.Rect(21 * TILE_SIZE, 19 * TILE_SIZE, (26 - 21 + 1) * TILE_SIZE, (20 - 19 + 1) * TILE_SIZE),
-            'leftUpperRectWall': pygame.Rect(19 * TILE_SIZE, 10 * TILE_SIZE, (26 - 19 + 1) * TILE_SIZE, (18 - 10 + 1) * TILE_SIZE),
-            'rightUpperRectWall' : pygame.Rect(37 * TILE_SIZE, 16 * TILE_SIZE, (42 - 37 + 1) * TILE_SIZE, (18 - 16 + 1) * TILE_SIZE),
-            'rightBottomRectWall': pygame.Rect(37 * TILE_SIZE, 21 * TILE_SIZE, (43 - 37 + 1) * TILE_SIZE, (24 - 21 + 1) * TILE_SIZE),
-            'bottomTrapWall': pygame.Rect(25 * TILE_SIZE, 49 * TILE_SIZE, (30 - 25 + 1) * TILE_SIZE, (51 - 49 + 1) * TILE_SIZE),
-            'rightMostWall': pygame.Rect(46 * TILE_SIZE, 32 * TILE_SIZE, (49 - 46 + 1) * TILE_SIZE, (38 - 32 + 1) * TILE_SIZE),
-            'rightUpperWall': pygame.Rect(49 * TILE_SIZE, 6 * TILE_SIZE, (53 - 49 + 1) * TILE_SIZE, (8 - 6 + 1) * TILE_SIZE),
-            'middleUpperWall': pygame.Rect(20 * TILE_SIZE, 1 * TILE_SIZE, (24 - 20 + 1) * TILE_SIZE, (6 - 1 + 1) * TILE_SIZE),
-            'centerUpperWall': pygame.Rect(30 * TILE_SIZE, 7 * TILE_SIZE, (33 - 30 + 1) * TILE_SIZE, (10 - 7 + 1) * TILE_SIZE),
-            'leftCenterWall': pygame.Rect(16 * TILE_SIZE, 25 * TILE_SIZE, (18 - 16 + 1) * TILE_SIZE, (27 - 25 + 1) * TILE_SIZE),
-            'instantDeath': pygame.Rect(34 * TILE_SIZE, 34 * TILE_SIZE, (37 - 34 + 1) * TILE_SIZE, (35 - 34 + 1) * TILE_SIZE),
-            'rightOfUpperRectWall': pygame.Rect(43 * TILE_SIZE, 10 * TILE_SIZE, (46 - 43 + 1) * TILE_SIZE, (16 - 10 + 1) * TILE_SIZE),
-            'centerBottomWall' : pygame.Rect(28 * TILE_SIZE, 40 * TILE_SIZE, (31 - 28 + 1) * TILE_SIZE, (42 - 40 + 1) * TILE_SIZE),
-            'exitClueEntry1' : pygame.Rect(15 * TILE_SIZE, 31 * TILE_SIZE, (17 - 15 + 1) * TILE_SIZE, (31 - 31 + 1) * TILE_SIZE),
-            'exitClueExit1' : pygame.Rect(9 * TILE_SIZE, 28 * TILE_SIZE, (14 - 9 + 1) * TILE_SIZE, (31 - 28 + 1) * TILE_SIZE),
-            'leftBottomWall' : pygame.Rect(1 * TILE_SIZE, 47 * TILE_SIZE, (4 - 1 + 1) * TILE_SIZE, (48 - 47 + 1) * TILE_SIZE),
-            'exitClueEntry2' : pygame.Rect(13 * TILE_SIZE, 46 * TILE_SIZE, (15 - 13 + 1) * TILE_SIZE, (47 - 46 + 1) * TILE_SIZE),
-            'exitClueExit2' : pygame.Rect(19 * TILE_SIZE, 50 * TILE_SIZE, (20 - 19 + 1) * TILE_SIZE, (52 - 50 + 1) * TILE_SIZE),
-        }
-
-        if rects['fullMap'].colliderect(self.player_rect):
-            self.update_map(10, 53, 12, 53, 0)
-            self.update_map(28, 53, 30, 53, 0)
-            self.update_map(42, 53, 44, 53, 0)
-            self.update_map(51, 53, 52, 53, 0)
-
-        if rects['trueExit'].colliderect(self.player_rect):
-            if not self.is_eligible:
-                self.update_map(3, 15, 3, 20, 0)
-                self.noEntry = True
-            elif self.is_eligible:
-                if self.exit_clue != [True, True, True]:
-                    self.update_map(3, 15, 3, 20, 0)
-                    self.noEntry = True
-                else:
-                    self.game_over = True
-
-        else:
-            if self.is_eligible:
-                self.update_map(3, 15, 3, 20, 2)
-                self.noEntry = False
-            else:
-                self.update_map(3, 15, 3, 20, 1)
-                self.noEntry = False
-
-        self.reach_center = rects['centerRectWall1'].colliderect(self.player_rect)
-
-        if rects['centerRectWall2'].colliderect(self.player_rect):
-            self.update_map(27, 19, 27, 20, 0)
-            self.update_map(31, 24, 32, 24, 0)
-            self.is_eligible = True
-        else:
-            self.update_map(27, 19, 27, 20, 1)
-            self.update_map(31, 24, 32, 24, 1)
-
-        if rects['upperTunnelWall'].colliderect(self.player_rect):
-            self.update_map(30, 10, 30, 14, 1)
-        else:
-            self.update_map(30, 10, 30, 14, 0)
-
-        if rects['bottomTunnelWall'].colliderect(self.player_rect):
-            self.update_map(31, 30, 32, 30, 0)
-            self.update_map(31, 24, 32, 24, 0)
-            self.is_trapped = True
-
-        if rects['leftTunnelWall'].colliderect(self.player_rect):
-            self.update_map(19, 19, 19, 20, 0)
-            self.update_map(27, 19, 27, 20, 0)
-            self.is_trapped = True
-
-        if rects['leftUpperRectWall'].colliderect(self.player_rect):
-            self.update_map(19, 10, 19, 11, 0)
-            self.update_map(20, 18, 26, 18, 1)
-        else:
-            self.update_map(19, 10, 19, 11, 1)
-            self.update_map(20, 18, 26, 18, 0)
-
-        if rects['rightUpperRectWall'].colliderect(self.player_rect):
-            self.update_map(37, 18, 42, 18, 1)
-        else:
-            self.update_map(37, 18, 42, 18, 0)
-
-        if rects['rightBottomRectWall'].colliderect(self.player_rect):
-            self.update_map(37, 21, 42, 21, 1)
-        else:
-            self.update_map(37, 21, 42, 21, 0)
-
-        if rects['bottomTrapWall'].colliderect(self.player_rect):
-            self.update_map(25, 47, 27, 47, 0)
-            self.update_map(28, 53, 30, 53, 0)
-            self.is_trapped = True
-
-        if rects['rightMostWall'].colliderect(self.player_rect):
-            self.update_map(46, 33, 46, 36, 0)
-        else:
-            self.update_map(46, 33, 46, 36, 1)
+            self.draw_restart_button()
 
-        if rects['rightUpperWall'].colliderect(self.player_rect):
-            self.update_map(50, 6, 52, 6, 1)
-            self.update_map(49, 7, 49, 8, 0)
-        else:
-            self.update_map(50, 6, 52, 6, 0)
-            self.update_map(49, 7, 49, 8, 1)
+    def draw_restart_button(self):
+        self.restart_button.draw(self.screen)
+        self.overlay_rects.append(self.restart_button.rect)
 
-        if rects['middleUpperWall'].colliderect(self.player_rect):
-            self.update_map(21, 6, 24, 6, 1)
-        else:
-            self.update_map(21, 6, 24, 6, 0)
-
-        if rects['centerUpperWall'].colliderect(self.player_rect):
-            self.update_map(31, 9, 32, 9, 0)
-        else:
-            self.update_map(31, 9, 32, 9, 1)
+    def commit_map_updates(self):
+        # The background redraws whatever the wall mask is told about
+        self.dirty_tiles.update(self.pending_tiles)
+        self.tiles_changed = self.tiles_changed or bool(self.pending_tiles)
+        super().commit_map_updates()
 
-        if rects['leftCenterWall'].colliderect(self.player_rect):
-            self.update_map(16, 27, 18, 27, 1)
-        else:
-            self.update_map(16, 27, 18, 27, 0)
-
-        if rects['instantDeath'].colliderect(self.player_rect):
-            if not self.is_eligible:
-                self.instantDeath = True
-            elif self.is_eligible:
-                self.exit_clue[2] = True
-                self.instantDeath = False
-
-        if rects['rightOfUpperRectWall'].colliderect(self.player_rect):
-            self.update_map(43, 11, 43, 15, 1)
-        else:
-            self.update_map(43, 11, 43, 15, 0)
-
-        if rects['centerBottomWall'].colliderect(self.player_rect):
-            self.update_map(31, 40, 31, 41, 0)
-        else:
-            self.update_map(31, 40, 31, 41, 1)
-
-        if rects['exitClueEntry1'].colliderect(self.player_rect):
-            if self.is_eligible:
-                self.update_map(15, 30, 15, 31, 1)
-        else:
-            self.update_map(15, 30, 15, 31, 0)
-
-        if rects['exitClueExit1'].colliderect(self.player_rect):
-            self.update_map(9, 30, 9, 31, 1)
-            self.exit_clue[0] = True
-        else:
-            self.update_map(9, 30, 9, 31, 0)
-
-        if rects['leftBottomWall'].colliderect(self.player_rect):
-            self.update_map(1, 48, 4, 48, 1)
-        else:
-            self.update_map(1, 48, 4, 48, 0)
-
-        if rects['exitClueEntry2'].colliderect(self.player_rect):
-            if self.is_eligible:
-                self.update_map(13, 47, 15, 47, 1)
-                self.update_map(13, 48, 13, 48, 1)
-        else:
-            self.update_map(13, 47, 15, 47, 0)
-            self.update_map(13, 48, 13, 48, 0)
+    def movement_controller(self):
+        action = action_from_keys(pygame.key.get_pressed())
+        if self.recorder is not None:
+            self.recorder.record(action)
+        self.step(action)
+        return action
 
-        if rects['exitClueExit2'].colliderect(self.player_rect):
-            self.update_map(20, 50, 20, 52, 1)
-            self.exit_clue[1] = True
-        else:
-            self.update_map(20, 50, 20, 52, 0)
+    def tick_state(self):
+        # Everything a tick reads besides the tiles, which commit_map_updates reports on
+        return (self.player_rect.topleft, self.flag_bits(),
+                tuple(self.exit_clue), frozenset(self.triggers.active))
 
-    def initialize_player(self):
-        self.player_rect = self.player_image.get_rect(centerx=200, centery=HEIGHT)
+    def restart_game(self):
+        if self.recorder is not None:
+            self.recorder.restart()
+        super().restart_game()
 
-    def initialize_map(self):
-        self.map_layout = self.load_map_from_csv(BASE_IMG_PATH + 'FinalMazeMap.csv')
-        self.map_creation = [row[:] for row in self.map_layout]
-        self.wall_rects = self.get_wall_rects()
+    def restore(self, snapshot):
+        # Changed tiles reach the background through commit_map_updates; the player is not drawn sliding back
+        super().restore(snapshot)
+        self.button_visible = False
+        self.previous_position = self.player_rect.topleft
+        self.draw_rect.topleft = self.player_rect.topleft
+
+    def tick(self):
+        self.previous_position = self.player_rect.topleft
+        state = self.tick_state()
+        self.tiles_changed = False
+        action = self.movement_controller()
+        # Input does nothing once the game is over, so only a restart can change things then
+        self.settled = ((action == 0 or self.done) and not self.tiles_changed
+                        and self.tick_state() == state)
+
+    def idle(self):
+        """True when the frame just drawn will stay right until an event arrives."""
+        return (self.settled and not self.full_redraw and not profiler.enabled
+                and self.draw_rect.topleft == self.player_rect.topleft)
+
+    def wait_for_event(self):
+        """Sleep until an event arrives and handle it, or until a direction key is found held."""
+        while self.running:
+            event = pygame.event.wait(IDLE_TIMEOUT)
+            if event.type != pygame.NOEVENT:
+                self.handle_event(event)
+                return
+            # A key pressed while the window was getting focus may come without an event
+            if not self.done and action_from_keys(pygame.key.get_pressed()):
+                self.settled = False
+                return
+
+    def reset_map(self):
+        super().reset_map()
+        self.chunk_surfaces.clear()
+        self.build_background()
 
     def reset_flags(self):
-        self.is_trapped = False
-        self.reach_center = False
-        self.instantDeath = False
-        self.is_eligible = False
-        self.noEntry = False
-        self.exit_clue = [False, False, False]
-        self.game_over = False
+        super().reset_flags()
         self.button_visible = False
 
-    def restart_game(self):
-        self.initialize_player()
-        self.initialize_map()
-        self.reset_flags()
-        
-
     def show_msg(self, text):
         lines = text.split('\n')
-        y_offset = HEIGHT // 2 - (len(lines) * FONT_SIZE + (len(lines) - 1) * LINE_SPACING) // 2
+        screen_width, screen_height = self.screen.get_size()
+        y_offset = screen_height // 2 - (len(lines) * FONT_SIZE + (len(lines) - 1) * LINE_SPACING) // 2
         for line in lines:
-            message_surface = self.font.render(line, True, TEXT_COLOR)
-            message_rect = message_surface.get_rect(center=(WIDTH // 2, y_offset))
+            message_surface = text_cache.render(self.font, line, True, TEXT_COLOR)
+            message_rect = message_surface.get_rect(center=(screen_width // 2, y_offset))
             self.screen.blit(message_surface, message_rect)
+            self.overlay_rects.append(message_rect)
+            profiler.count('blits')
+            profiler.count('rects')
             y_offset += FONT_SIZE + LINE_SPACING
     
+    def present(self):
+        # Only the areas that changed since the last frame are pushed to the display
+        if self.full_redraw or not USE_DIRTY_RECTS:
+            pygame.display.flip()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.dirty_rects + self.previous_overlay_rects + self.overlay_rects)
+        self.previous_overlay_rects = self.overlay_rects
+        self.overlay_rects = []
+        self.dirty_rects = []
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            self.handle_event(event)
+
+    def handle_event(self, event):
+        # Any event may be a key going down or the game restarting, so ticks run again until they settle
+        self.settled = False
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type in (pygame.VIDEORESIZE, pygame.WINDOWEXPOSED):
+            self.screen = pygame.display.get_surface()
+            self.full_redraw = True
+        elif event.type == pygame.MOUSEBUTTONDOWN and self.restart_button.is_clicked(event.pos):
+            if self.button_visible:
+                self.restart_game()
+        elif event.type == pygame.KEYDOWN and event.key == PROFILE_KEY:
+            profiler.toggle()
+            self.profile_shown_at = 0.0
+            # The overlay's last lines have to be drawn over
+            self.full_redraw = True
+        elif event.type == pygame.KEYDOWN and event.key == PROFILE_DUMP_KEY:
+            profiler.write_csv(PROFILE_TRACE + '.csv')
+            profiler.write_json(PROFILE_TRACE + '.json')
+
     def game(self):
+        previous_time = time.perf_counter()
+        lag = 0.0
         while self.running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN and self.restart_button.is_clicked(event.pos):
-                    if self.button_visible:
-                        self.restart_game()
-
-            self.movement_controller()
-            self.screen.fill((255, 255, 255))
+            self.handle_events()
+
+            # Run as many fixed ticks as the time since the last frame holds: a slow frame means
+            # several ticks before the next one is drawn, never a slower game
+            now = time.perf_counter()
+            lag = min(lag + now - previous_time, MAX_LAG)
+            previous_time = now
+            while lag >= TICK_TIME:
+                self.tick()
+                lag -= TICK_TIME
+            self.interpolate(lag / TICK_TIME)
+
+            self.update_camera()
+            if self.full_redraw:
+                self.screen.fill((255, 255, 255))
             self.draw_map()
-            self.screen.blit(self.player_image, self.player_rect.topleft)
-            pygame.display.flip()
+            self.draw_player()
+            if profiler.enabled:
+                self.draw_profile()
+            self.present()
             self.clock.tick(FPS)
+            profiler.end_frame()
+
+            if EVENT_DRIVEN and self.idle():
+                self.wait_for_event()
+                # The time asleep is not time the game has to catch up on
+                previous_time = time.perf_counter()
+                lag = 0.0
 
+        if self.recorder is not None:
+            Recording.from_session(self.recorder, self, tick_rate=TICK_RATE).save(self.record_path)
         pygame.quit()
 
 if __name__ == "__main__":
-    MazeGame().game()
+    parser = argparse.ArgumentParser(description="Play the maze")
+    # An optional map file, e.g. a big maze from maze_generator.py
+    parser.add_argument('map', nargs='?', default=None)
+    parser.add_argument('--record', metavar='FILE', help="record the session's input for recording.py to replay")
+    parser.add_argument('--detect-traps', action='store_true', default=DETECT_TRAPS,
+                        help="end the game as trapped whenever the exit can no longer be reached")
+    args = parser.parse_args()
+    MazeGame(args.map, args.record, args.detect_traps).game()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from tile_grid import TileGrid
+from triggers import TriggerZone
+
+CACHE_EXTENSION = '.mazec'
+CACHE_MAGIC = b'MAZC'
+# 3: bare CSV maps compile with zones on their exit tiles
+CACHE_VERSION = 3
+# magic, version, width, height, source mtime (ns), source size, source sha1, trigger table length
+HEADER = struct.Struct('<4sHIIqq20sI')
+
+
+class CompiledMap:
+    """A map ready for the game loop: packed tile bytes and the trigger zones.
+
+    The wall mask is not stored, the tile grid builds it as it is read (TileGrid.wall_mask, or
+    per chunk for a ChunkedTileGrid), so a compiled map is one byte per tile.
+    """
+
+    def __init__(self, width, height, tiles, trigger_zones):
+        self.width = width
+        self.height = height
+        self.tiles = tiles
+        self.trigger_zones = trigger_zones
+
+
+def cache_path(source):
+    # The whole source name, so a map's CSV and Tiled exports keep caches of their own
+    return source + CACHE_EXTENSION
+
+
+def source_hash(source):
+    with open(source, 'rb') as source_file:
+        return hashlib.sha1(source_file.read()).digest()
+
+
+def compile_map(rows, trigger_zones):
+    grid = TileGrid.from_rows(rows)
+    return CompiledMap(grid.width, grid.height, bytes(grid.data), trigger_zones)
+
+
+def pack_compiled_map(compiled, mtime_ns=0, size=0, digest=bytes(20)):
+    """The cache file contents: header, tiles, then the trigger table as JSON."""
+    trigger_table = json.dumps([zone.spec() for zone in compiled.trigger_zones]).encode()
+    header = HEADER.pack(CACHE_MAGIC, CACHE_VERSION, compiled.width, compiled.height,
+                         mtime_ns, size, digest, len(trigger_table))
+    return header + compiled.tiles + trigger_table
+
+
+def unpack_compiled_map(data):
+    """Return (CompiledMap, source mtime_ns, source size, source sha1), or None if data is not a valid cache."""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, width, height, mtime_ns, size, digest, table_length = HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    area = width * height
+    if len(data) != HEADER.size + area + table_length:
+        return None
+    offset = HEADER.size
+    tiles = bytes(data[offset:offset + area])
+    trigger_table = json.loads(bytes(data[offset + area:]).decode())
+    trigger_zones = [TriggerZone.from_spec(spec) for spec in trigger_table]
+    return CompiledMap(width, height, tiles, trigger_zones), mtime_ns, size, digest
+
+
+def write_cache(path, compiled, stat, digest):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as cache_file:
+        cache_file.write(pack_compiled_map(compiled, stat.st_mtime_ns, stat.st_size, digest))
+    os.replace(temp_path, path)
+
+
+def read_cache(path, stat):
+    """Return (CompiledMap or None, source sha1 stored in the header, whether mtime/size still match)."""
+    with open(path, 'rb') as cache_file, mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        unpacked = unpack_compiled_map(data)
+    if unpacked is None:
+        return None, None, False
+    compiled, mtime_ns, size, digest = unpacked
+    return compiled, digest, mtime_ns == stat.st_mtime_ns and size == stat.st_size
+
+
+def view_compiled_map(data):
+    """A CompiledMap whose tiles are a view of data, which holds a compiled map; None if it does not.
+
+    Nothing is copied, so data (a memory map, a shared memory block) has to stay open while the map is used.
+    """
+    if len(data) < HEADER.size:
+        return None
+    magic, version, width, height, mtime_ns, size, digest, table_length = HEADER.unpack_from(data)
+    area = width * height
+    if magic != CACHE_MAGIC or version != CACHE_VERSION or len(data) != HEADER.size + area + table_length:
+        return None
+    view = memoryview(data)
+    offset = HEADER.size
+    trigger_table = json.loads(bytes(view[offset + area:]).decode())
+    trigger_zones = [TriggerZone.from_spec(spec) for spec in trigger_table]
+    return CompiledMap(width, height, view[offset:offset + area], trigger_zones)
+
+
+def open_compiled_map(path):
+    """Map a compiled map file into memory instead of reading it.
+
+    The tiles of the result are a view of the mapped file, so the pages behind them are only
+    read from disk when something looks at them, as ChunkStore does.
+    """
+    with open(path, 'rb') as cache_file:
+        data = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+    compiled = view_compiled_map(data)
+    if compiled is None:
+        raise ValueError(f"Not a compiled map: {path}")
+    return compiled
+
+
+def load_compiled_map(source, load_source):
+    """Load source through its compiled cache, rebuilding the cache with load_source when the source changed.
+
+    load_source(filename) must return (rows of tile values, trigger zones).
+    """
+    stat = os.stat(source)
+    path = cache_path(source)
+    digest = None
+    if os.path.exists(path):
+        try:
+            compiled, cached_digest, unchanged = read_cache(path, stat)
+        except (OSError, ValueError):
+            compiled = None
+        if compiled is not None:
+            if unchanged:
+                return compiled
+            # Touched but not edited: keep the cache and just refresh its timestamp
+            digest = source_hash(source)
+            if digest == cached_digest:
+                try:
+                    write_cache(path, compiled, stat, digest)
+                except OSError:
+                    pass
+                return compiled
+
+    compiled = compile_map(*load_source(source))
+    try:
+        write_cache(path, compiled, stat, digest or source_hash(source))
+    except OSError:
+        # A read-only asset directory just means no cache
+        pass
+    return compiled
@@ -0,0 +1,262 @@
+import argparse
+import json
+import random
+from array import array
+
+from map_cache import CACHE_EXTENSION, CACHE_MAGIC, CACHE_VERSION, HEADER
+from tile_grid import TileGrid
+from triggers import EXIT_TILE, exit_zone
+
+# Generated mazes use the game's tile values
+WALL, PATH, EXIT = 0, 1, EXIT_TILE
+
+
+def cell_counts(width, height):
+    """Cells sit on odd tile coordinates, with walls between them and around the border."""
+    if width < 3 or height < 3:
+        raise ValueError("A maze needs at least 3x3 tiles")
+    return (width - 1) // 2, (height - 1) // 2
+
+
+class CellCarver:
+    """Carves cells and the walls between neighbouring cells into a flat tile bytearray."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.cells_width, self.cells_height = cell_counts(width, height)
+        self.tiles = bytearray(width * height)
+
+    def tile(self, cell):
+        return (2 * (cell // self.cells_width) + 1) * self.width + 2 * (cell % self.cells_width) + 1
+
+    def carve(self, cell, other=None):
+        tile = self.tile(cell)
+        self.tiles[tile] = PATH
+        if other is not None:
+            other_tile = self.tile(other)
+            self.tiles[other_tile] = PATH
+            # Neighbouring cells are two tiles apart, so the wall between them is the midpoint
+            self.tiles[(tile + other_tile) // 2] = PATH
+
+    def neighbours(self, cell):
+        cells_width = self.cells_width
+        x = cell % cells_width
+        if x > 0:
+            yield cell - 1
+        if x < cells_width - 1:
+            yield cell + 1
+        if cell >= cells_width:
+            yield cell - cells_width
+        if cell < cells_width * (self.cells_height - 1):
+            yield cell + cells_width
+
+
+def carve_backtracker(carver, rng):
+    """Iterative recursive backtracker: long winding corridors, no recursion limit."""
+    cells = carver.cells_width * carver.cells_height
+    visited = bytearray(cells)
+    start = rng.randrange(cells)
+    visited[start] = 1
+    carver.carve(start)
+    stack = array('l', [start])
+    while stack:
+        cell = stack[-1]
+        options = [neighbour for neighbour in carver.neighbours(cell) if not visited[neighbour]]
+        if not options:
+            stack.pop()
+            continue
+        neighbour = options[rng.randrange(len(options))]
+        visited[neighbour] = 1
+        carver.carve(cell, neighbour)
+        stack.append(neighbour)
+
+
+def carve_kruskal(carver, rng):
+    """Randomized Kruskal: knock down shuffled walls between cells that are not yet connected."""
+    cells_width, cells_height = carver.cells_width, carver.cells_height
+    cells = cells_width * cells_height
+    parent = array('l', range(cells))
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    # Wall 2 * cell joins cell to its right neighbour, 2 * cell + 1 to the one below
+    walls = array('l', (wall for wall in range(2 * cells)
+                        if (wall & 1 and wall // 2 < cells - cells_width)
+                        or (not wall & 1 and (wall // 2) % cells_width < cells_width - 1)))
+    rng.shuffle(walls)
+    for cell in range(cells):
+        carver.carve(cell)
+    for wall in walls:
+        cell = wall >> 1
+        other = cell + cells_width if wall & 1 else cell + 1
+        root, other_root = find(cell), find(other)
+        if root != other_root:
+            parent[other_root] = root
+            carver.carve(cell, other)
+
+
+def carve_wilson(carver, rng):
+    """Wilson's algorithm: loop-erased random walks, an unbiased sample of all possible mazes."""
+    cells = carver.cells_width * carver.cells_height
+    in_maze = bytearray(cells)
+    next_cell = array('l', [0]) * cells
+    first = rng.randrange(cells)
+    in_maze[first] = 1
+    carver.carve(first)
+    for start in range(cells):
+        if in_maze[start]:
+            continue
+        # Walk until the maze is hit; overwriting next_cell on revisits erases the loops
+        cell = start
+        while not in_maze[cell]:
+            options = list(carver.neighbours(cell))
+            next_cell[cell] = options[rng.randrange(len(options))]
+            cell = next_cell[cell]
+        cell = start
+        while not in_maze[cell]:
+            in_maze[cell] = 1
+            carver.carve(cell, next_cell[cell])
+            cell = next_cell[cell]
+
+
+CARVERS = {
+    'backtracker': carve_backtracker,
+    'kruskal': carve_kruskal,
+    'wilson': carve_wilson,
+}
+ALGORITHMS = tuple(CARVERS) + ('eller',)
+
+
+def eller_rows(width, height, rng):
+    """Eller's algorithm: yield the maze one tile row at a time, keeping only one row of cell sets."""
+    cells_width, cells_height = cell_counts(width, height)
+    yield bytes(width)
+    sets = list(range(cells_width))
+    for cell_y in range(cells_height):
+        last_row = cell_y == cells_height - 1
+        row = bytearray(width)
+        row[1:2 * cells_width:2] = bytes([PATH]) * cells_width
+
+        # Join neighbours in different sets at random; the last row joins all of them
+        parent = list(range(cells_width))
+        for x in range(cells_width - 1):
+            root = sets[x]
+            while parent[root] != root:
+                root = parent[root]
+            other_root = sets[x + 1]
+            while parent[other_root] != other_root:
+                other_root = parent[other_root]
+            if root != other_root and (last_row or rng.random() < 0.5):
+                parent[other_root] = root
+                row[2 * x + 2] = PATH
+        for x in range(cells_width):
+            root = sets[x]
+            while parent[root] != root:
+                root = parent[root]
+            sets[x] = root
+        yield bytes(row)
+        if last_row:
+            break
+
+        # Every set carries on downwards at least once
+        members = {}
+        for x in range(cells_width):
+            members.setdefault(sets[x], []).append(x)
+        below = bytearray(width)
+        labels = {}
+        next_sets = [0] * cells_width
+        carried = set()
+        for set_cells in members.values():
+            down = [x for x in set_cells if rng.random() < 0.5]
+            if not down:
+                down = [set_cells[rng.randrange(len(set_cells))]]
+            for x in down:
+                below[2 * x + 1] = PATH
+                next_sets[x] = labels.setdefault(sets[x], len(labels))
+                carried.add(x)
+        # Cells that were not joined from above start a new set
+        label = len(labels)
+        for x in range(cells_width):
+            if x not in carried:
+                next_sets[x] = label
+                label += 1
+        sets = next_sets
+        yield bytes(below)
+
+    for _ in range(height - 2 * cells_height):
+        yield bytes(width)
+
+
+def exit_position(width, height):
+    # The bottom right cell, diagonally across from where the player starts looking
+    cells_width, cells_height = cell_counts(width, height)
+    return 2 * cells_width - 1, 2 * cells_height - 1
+
+
+def maze_rows(width, height, algorithm='eller', seed=None):
+    """Yield the tile rows of a width x height maze; only Eller's avoids building the whole grid."""
+    rng = random.Random(seed)
+    if algorithm == 'eller':
+        exit_x, exit_y = exit_position(width, height)
+        for y, row in enumerate(eller_rows(width, height, rng)):
+            if y == exit_y:
+                row = row[:exit_x] + bytes([EXIT]) + row[exit_x + 1:]
+            yield row
+        return
+    grid = generate_maze(width, height, algorithm, seed)
+    for y in range(height):
+        yield bytes(grid.row(y))
+
+
+def generate_maze(width, height, algorithm='backtracker', seed=None):
+    """Return a width x height TileGrid of WALL/PATH tiles and one EXIT, the same format the game loads."""
+    if algorithm == 'eller':
+        return TileGrid(width, height, b''.join(maze_rows(width, height, algorithm, seed)))
+    if algorithm not in CARVERS:
+        raise ValueError(f"Unknown maze algorithm: {algorithm}")
+    carver = CellCarver(width, height)
+    CARVERS[algorithm](carver, random.Random(seed))
+    grid = TileGrid(width, height, carver.tiles)
+    grid[exit_position(width, height)] = EXIT
+    return grid
+
+
+def write_maze_csv(filename, width, height, algorithm='eller', seed=None):
+    with open(filename, 'w', newline='') as csvfile:
+        for row in maze_rows(width, height, algorithm, seed):
+            csvfile.write(','.join(map(str, row)) + '\n')
+
+
+def write_maze_binary(filename, width, height, algorithm='eller', seed=None):
+    """Write a compiled map (see map_cache) streaming the rows to disk; its one trigger zone is the exit."""
+    exit_x, exit_y = exit_position(width, height)
+    trigger_table = json.dumps([exit_zone((exit_x, exit_y, exit_x, exit_y)).spec()]).encode()
+    with open(filename, 'wb') as binary_file:
+        binary_file.write(HEADER.pack(CACHE_MAGIC, CACHE_VERSION, width, height, 0, 0, bytes(20), len(trigger_table)))
+        for row in maze_rows(width, height, algorithm, seed):
+            binary_file.write(row)
+        binary_file.write(trigger_table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a maze map the game can load")
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default='eller')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', '-o', required=True,
+                        help=f"a .csv file, or a {CACHE_EXTENSION} compiled map")
+    args = parser.parse_args()
+
+    if args.output.endswith(CACHE_EXTENSION):
+        write_maze_binary(args.output, args.width, args.height, args.algorithm, args.seed)
+    else:
+        write_maze_csv(args.output, args.width, args.height, args.algorithm, args.seed)
+
+
+if __name__ == "__main__":
+    main()
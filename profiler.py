@@ -0,0 +1,147 @@
+import csv
+import json
+import time
+from collections import deque
+
+# Frames kept for the percentiles and the trace
+PROFILE_FRAMES = 600
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, percent):
+    # Nearest rank, so every result is a time that was actually measured
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-percent * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+class FrameProfiler:
+    """Time spent in named phases of each frame and counts of events in them, over the last frames.
+
+    Phases are methods of an object: while the profiler is enabled they are wrapped with timers
+    on the object itself, and disabling removes the wrappers again, so a disabled profiler only
+    costs the enabled check in count(). Times are inclusive, a phase called from another one
+    counts towards both.
+    """
+
+    def __init__(self, frames=PROFILE_FRAMES):
+        self.enabled = False
+        self.owner = None
+        self.phases = {}
+        self.replaced = {}
+        self.frames = deque(maxlen=frames)
+        self.current = {}
+        self.counts = {}
+        self.frame_start = None
+
+    def attach(self, owner, phases):
+        """phases maps method names of owner to the phase names they are reported under."""
+        if self.enabled:
+            self.disable()
+        self.owner = owner
+        self.phases = dict(phases)
+
+    def timed(self, phase, method):
+        current = self.current
+        perf_counter = time.perf_counter
+
+        def timed_method(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                current[phase] = current.get(phase, 0.0) + perf_counter() - start
+        return timed_method
+
+    def enable(self):
+        if self.enabled:
+            return
+        for name, phase in self.phases.items():
+            # Remember what the object itself held, usually nothing over the class's method
+            self.replaced[name] = vars(self.owner).get(name)
+            setattr(self.owner, name, self.timed(phase, getattr(self.owner, name)))
+        self.enabled = True
+        self.current.clear()
+        self.counts.clear()
+        self.frame_start = time.perf_counter()
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for name, replaced in self.replaced.items():
+            if replaced is None:
+                delattr(self.owner, name)
+            else:
+                setattr(self.owner, name, replaced)
+        self.replaced.clear()
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def end_frame(self):
+        """Close the frame that started at the previous call, with its total time under 'frame'."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        record = {'frame': now - self.frame_start}
+        record.update(self.current)
+        record.update(self.counts)
+        self.frames.append(record)
+        self.current.clear()
+        self.counts.clear()
+        self.frame_start = now
+
+    def columns(self):
+        times = ['frame'] + list(dict.fromkeys(self.phases.values()))
+        counts = sorted({name for record in self.frames for name in record} - set(times))
+        return times, counts
+
+    def summary(self):
+        """{phase or counter: {'p50': ..., 'p95': ..., 'p99': ..., 'mean': ...}}, times in milliseconds."""
+        times, counts = self.columns()
+        summary = {}
+        for name in times + counts:
+            scale = 1000 if name in times else 1
+            values = sorted(record.get(name, 0) * scale for record in self.frames)
+            stats = {f"p{percent}": percentile(values, percent) for percent in PERCENTILES}
+            stats['mean'] = sum(values) / len(values) if values else 0.0
+            summary[name] = stats
+        return summary
+
+    def overlay_lines(self):
+        times, counts = self.columns()
+        summary = self.summary()
+        lines = [f"{len(self.frames)} frames  " + "/".join(f"p{percent}" for percent in PERCENTILES) + " ms"]
+        for name in times:
+            lines.append(f"{name:<10}" + " ".join(f"{summary[name][f'p{percent}']:6.2f}" for percent in PERCENTILES))
+        for name in counts:
+            lines.append(f"{name:<10}" + " ".join(f"{summary[name][f'p{percent}']:6.0f}" for percent in PERCENTILES))
+        return lines
+
+    def write_csv(self, path):
+        """One row per frame, times in milliseconds."""
+        times, counts = self.columns()
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([f"{name}_ms" for name in times] + counts)
+            for record in self.frames:
+                writer.writerow([round(record.get(name, 0.0) * 1000, 4) for name in times] +
+                                [record.get(name, 0) for name in counts])
+
+    def write_json(self, path):
+        """The summary and every frame, times in milliseconds."""
+        times, counts = self.columns()
+        trace = [{name: record.get(name, 0.0) * 1000 if name in times else record.get(name, 0)
+                  for name in times + counts} for record in self.frames]
+        with open(path, 'w') as json_file:
+            json.dump({'summary': self.summary(), 'frames': trace}, json_file, indent=1)
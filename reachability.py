@@ -0,0 +1,197 @@
+from array import array
+from collections import deque
+
+
+class GridConnectivity:
+    """Connected components of the walkable tiles (anything but 0) of a tile grid, kept up to date as doors change.
+
+    Tiles that never change are labelled into static components once. Door tiles, the ones that
+    may change, sit on top as extra nodes of a union-find with rollback: opening a door unions it
+    with its open neighbours, and closing one rolls the unions back to the static base and replays
+    the doors that are still open. Tiles written that were not declared doors become doors then.
+    """
+
+    def __init__(self, grid, door_tiles=()):
+        self.width = grid.width
+        self.height = grid.height
+        self.layout = grid
+        self.door_index = {}
+        for x, y in door_tiles:
+            if self.layout.in_bounds(x, y):
+                self.door_index.setdefault(y * self.width + x, len(self.door_index))
+        self.grid = grid
+        self.build_base()
+
+    def build_base(self):
+        """Label the static walkable tiles with a component each, by flood fill."""
+        width, size = self.width, self.width * self.height
+        walkable = self.layout.mask(*range(1, 256))
+        self.component = array('l', [-1]) * size
+        components = 0
+        for start in range(size):
+            if not walkable[start] or start in self.door_index or self.component[start] != -1:
+                continue
+            self.component[start] = components
+            queue = deque([start])
+            while queue:
+                index = queue.popleft()
+                x = index % width
+                for neighbour in (index - 1 if x > 0 else -1, index + 1 if x < width - 1 else -1,
+                                  index - width, index + width):
+                    if (0 <= neighbour < size and walkable[neighbour] and self.component[neighbour] == -1
+                            and neighbour not in self.door_index):
+                        self.component[neighbour] = components
+                        queue.append(neighbour)
+            components += 1
+        self.static_components = components
+
+        # Union-find nodes: the static components first, then one per door tile
+        nodes = components + len(self.door_index)
+        self.parent = array('l', range(nodes))
+        self.size = array('l', [1]) * nodes
+        self.history = []
+        self.open_doors = bytearray(len(self.door_index))
+        self.pending = set(self.door_index)
+        self.area_cache = {}
+
+    def attach(self, grid):
+        """Follow a new grid, e.g. a fresh copy of the layout after a restart."""
+        self.grid = grid
+        self.pending.update(self.door_index)
+
+    def tiles_changed(self, positions):
+        indices = {y * self.width + x for x, y in positions}
+        new_doors = indices.difference(self.door_index)
+        if new_doors:
+            # Tiles no trigger was known to write: the static components have to be rebuilt without them
+            for index in sorted(new_doors):
+                self.door_index[index] = len(self.door_index)
+            self.build_base()
+        self.pending.update(indices)
+
+    def node(self, index):
+        door = self.door_index.get(index)
+        if door is not None:
+            return self.static_components + door if self.open_doors[door] else -1
+        return self.component[index]
+
+    def find(self, node):
+        # No path compression, so every union can be undone
+        while self.parent[node] != node:
+            node = self.parent[node]
+        return node
+
+    def union(self, node, other):
+        root, other_root = self.find(node), self.find(other)
+        if root == other_root:
+            return
+        if self.size[root] < self.size[other_root]:
+            root, other_root = other_root, root
+        self.parent[other_root] = root
+        self.size[root] += self.size[other_root]
+        self.history.append(other_root)
+
+    def rollback(self):
+        while self.history:
+            child = self.history.pop()
+            root = self.parent[child]
+            self.size[root] -= self.size[child]
+            self.parent[child] = child
+
+    def open_door(self, index):
+        node = self.static_components + self.door_index[index]
+        width = self.width
+        x = index % width
+        for neighbour in (index - 1 if x > 0 else -1, index + 1 if x < width - 1 else -1,
+                          index - width, index + width):
+            if 0 <= neighbour < len(self.component):
+                other = self.node(neighbour)
+                if other != -1:
+                    self.union(node, other)
+
+    def refresh(self):
+        """Apply the door changes since the last query."""
+        if not self.pending:
+            return
+        grid, width = self.grid, self.width
+        opened, closed = [], False
+        for index in self.pending:
+            door = self.door_index[index]
+            is_open = 1 if grid[index % width, index // width] else 0
+            if is_open != self.open_doors[door]:
+                self.open_doors[door] = is_open
+                if is_open:
+                    opened.append(index)
+                else:
+                    closed = True
+        self.pending.clear()
+        if closed:
+            self.rollback()
+            opened = [index for index, door in self.door_index.items() if self.open_doors[door]]
+        for index in opened:
+            self.open_door(index)
+
+    def root(self, x, y):
+        """The component of a walkable tile, or -1 for walls and tiles off the grid."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return -1
+        self.refresh()
+        node = self.node(y * self.width + x)
+        return -1 if node == -1 else self.find(node)
+
+    def area_nodes(self, area):
+        """The static components and door tiles inside an area (inclusive tile corners), cached per area."""
+        nodes = self.area_cache.get(area)
+        if nodes is None:
+            start_x, start_y, end_x, end_y = area
+            components, doors = set(), []
+            for y in range(max(start_y, 0), min(end_y, self.height - 1) + 1):
+                for x in range(max(start_x, 0), min(end_x, self.width - 1) + 1):
+                    index = y * self.width + x
+                    if index in self.door_index:
+                        doors.append(index)
+                    elif self.component[index] != -1:
+                        components.add(self.component[index])
+            nodes = self.area_cache[area] = (components, doors)
+        return nodes
+
+    def area_roots(self, area):
+        self.refresh()
+        components, doors = self.area_nodes(area)
+        roots = {self.find(component) for component in components}
+        for index in doors:
+            node = self.node(index)
+            if node != -1:
+                roots.add(self.find(node))
+        return roots
+
+    def reachable(self, tiles, goal_areas, openings=()):
+        """True if one of tiles can get to one of goal_areas.
+
+        openings are (zone area, door areas) pairs: once the zone can be reached, the player can
+        get its door areas opened, so the walls there only count as closed until then.
+        """
+        self.refresh()
+        roots = {self.root(x, y) for x, y in tiles}
+        roots.discard(-1)
+        goal_roots = set()
+        for area in goal_areas:
+            goal_roots |= self.area_roots(area)
+        zones = [opening for opening in openings if opening[1]]
+        doors = []
+        while roots.isdisjoint(goal_roots):
+            for opening in list(zones):
+                if not self.area_roots(opening[0]).isdisjoint(roots):
+                    zones.remove(opening)
+                    doors.extend(opening[1])
+            grown = False
+            for start_x, start_y, end_x, end_y in list(doors):
+                # An open door joins whatever borders it
+                joined = self.area_roots((start_x - 1, start_y - 1, end_x + 1, end_y + 1))
+                if not joined.isdisjoint(roots):
+                    doors.remove((start_x, start_y, end_x, end_y))
+                    roots |= joined
+                    grown = True
+            if not grown:
+                return False
+        return True
@@ -0,0 +1,239 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+from itertools import repeat
+
+from rollout import episode_rng, random_policy
+from simulation import FLAGS, MazeSimulation
+
+RECORDING_EXTENSION = '.mzr'
+RECORDING_MAGIC = b'MZRC'
+# 2: swept movement, so sessions recorded under the old destination-only rule replay differently
+RECORDING_VERSION = 2
+# magic, version, tick rate, seed, map sha1, options, ticks,
+# final player rect (x, y, width, height), final flag bits, final grid crc32
+HEADER = struct.Struct('<4sHHq20sIIiiiiII')
+# Options bits
+DETECT_TRAPS = 1
+# An input that is not a tick: the player pressed restart
+RESTART = 0x10
+
+FinalState = namedtuple('FinalState', 'rect flags checksum')
+ReplayResult = namedtuple('ReplayResult', 'path ok ticks expected actual elapsed')
+
+
+def map_hash(compiled_map):
+    """sha1 of a compiled map's tiles and triggers, so a recording only replays on the map it was made on."""
+    digest = hashlib.sha1(compiled_map.tiles)
+    digest.update(json.dumps([zone.spec() for zone in compiled_map.trigger_zones]).encode())
+    return digest.digest()
+
+
+def grid_checksum(grid):
+    checksum = 0
+    for y in range(grid.height):
+        checksum = zlib.crc32(grid.row(y), checksum)
+    return checksum
+
+
+def final_state(simulation):
+    # The snapshot's flag bits, then a bit per exit clue above them
+    flags = simulation.flag_bits()
+    for bit, found in enumerate(simulation.exit_clue, len(FLAGS)):
+        if found:
+            flags |= 1 << bit
+    return FinalState(tuple(simulation.player_rect), flags, grid_checksum(simulation.map_creation))
+
+
+def write_varint(output, value):
+    while value >= 0x80:
+        output.append(value & 0x7f | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class InputRecorder:
+    """The per-tick action bitmasks of a session as [input, repeat count] runs, with restarts in between."""
+
+    def __init__(self):
+        self.runs = []
+        self.ticks = 0
+
+    def record(self, action):
+        if self.runs and self.runs[-1][0] == action:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([action, 1])
+        self.ticks += 1
+
+    def restart(self):
+        self.runs.append([RESTART, 1])
+
+
+class Recording:
+    """A recorded session: the header that pins down the map and settings, the input runs and the final state."""
+
+    def __init__(self, runs, ticks, final, map_digest, seed=0, tick_rate=60, detect_traps=False):
+        self.runs = runs
+        self.ticks = ticks
+        self.final = final
+        self.map_digest = map_digest
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.detect_traps = detect_traps
+
+    @classmethod
+    def from_session(cls, recorder, simulation, seed=0, tick_rate=60):
+        return cls([tuple(run) for run in recorder.runs], recorder.ticks, final_state(simulation),
+                   map_hash(simulation.compiled_map), seed, tick_rate, simulation.detect_traps)
+
+    def pack(self):
+        options = DETECT_TRAPS if self.detect_traps else 0
+        rect, flags, checksum = self.final
+        output = bytearray(HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.tick_rate, self.seed,
+                                       self.map_digest, options, self.ticks, *rect, flags, checksum))
+        for action, count in self.runs:
+            output.append(action)
+            write_varint(output, count)
+        return bytes(output)
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("Not a recording")
+        (magic, version, tick_rate, seed, map_digest, options, ticks,
+         x, y, width, height, flags, checksum) = HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC:
+            raise ValueError("Not a recording")
+        if version != RECORDING_VERSION:
+            raise ValueError(f"Recording version {version}, this game replays version {RECORDING_VERSION}")
+        runs = []
+        offset = HEADER.size
+        while offset < len(data):
+            action = data[offset]
+            count, offset = read_varint(data, offset + 1)
+            runs.append((action, count))
+        return cls(runs, ticks, FinalState((x, y, width, height), flags, checksum), map_digest,
+                   seed, tick_rate, bool(options & DETECT_TRAPS))
+
+    def save(self, path):
+        with open(path, 'wb') as recording_file:
+            recording_file.write(self.pack())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as recording_file:
+            return cls.unpack(recording_file.read())
+
+
+def replay(recording, simulation):
+    """Run a recording from a fresh game and return (final state, ticks run).
+
+    Ticks after the game ended do nothing in the game either, so they are skipped.
+    """
+    simulation.detect_traps = recording.detect_traps
+    simulation.restart_game()
+    ticks = 0
+    for action, count in recording.runs:
+        if action == RESTART:
+            simulation.restart_game()
+        elif not simulation.done:
+            simulation.run(repeat(action, count))
+        ticks += 0 if action == RESTART else count
+    return final_state(simulation), ticks
+
+
+def verify(paths, map_file=None):
+    """Replay every recording in paths on one simulation, yielding a ReplayResult each."""
+    simulation = MazeSimulation(map_file)
+    digest = map_hash(simulation.compiled_map)
+    for path in paths:
+        recording = Recording.load(path)
+        if recording.map_digest != digest:
+            raise ValueError(f"{path} was recorded on a different map")
+        start = time.perf_counter()
+        actual, ticks = replay(recording, simulation)
+        yield ReplayResult(path, actual == recording.final and ticks == recording.ticks, ticks,
+                           recording.final, actual, time.perf_counter() - start)
+
+
+def record_random_sessions(directory, sessions, ticks, seed=0, map_file=None, detect_traps=False):
+    """Record sessions of the rollout random policy, e.g. to build a regression corpus before changing map_logic."""
+    os.makedirs(directory, exist_ok=True)
+    simulation = MazeSimulation(map_file, detect_traps=detect_traps)
+    paths = []
+    for session in range(sessions):
+        rng = episode_rng(seed, session)
+        recorder = InputRecorder()
+        simulation.restart_game()
+        for _ in range(ticks):
+            action = random_policy(simulation, rng)
+            recorder.record(action)
+            simulation.step(action)
+            if simulation.done and rng.random() < 0.5:
+                recorder.restart()
+                simulation.restart_game()
+        path = os.path.join(directory, f"session_{session:05d}{RECORDING_EXTENSION}")
+        Recording.from_session(recorder, simulation, seed).save(path)
+        paths.append(path)
+    return paths
+
+
+def recording_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '*' + RECORDING_EXTENSION)))
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record maze sessions and verify them by replaying headless")
+    parser.add_argument('--map', default=None)
+    commands = parser.add_subparsers(dest='command', required=True)
+    verify_parser = commands.add_parser('verify', help="replay recordings and compare their final states")
+    verify_parser.add_argument('paths', nargs='+', help="recordings, or directories of them")
+    record_parser = commands.add_parser('record', help="record random-policy sessions into a directory")
+    record_parser.add_argument('directory')
+    record_parser.add_argument('--sessions', type=int, default=100)
+    record_parser.add_argument('--ticks', type=int, default=2000)
+    record_parser.add_argument('--seed', type=int, default=0)
+    record_parser.add_argument('--detect-traps', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        paths = record_random_sessions(args.directory, args.sessions, args.ticks, args.seed,
+                                       args.map, args.detect_traps)
+        print(f"{len(paths)} sessions recorded in {args.directory}")
+        return
+
+    results = list(verify(recording_paths(args.paths), args.map))
+    failures = [result for result in results if not result.ok]
+    ticks = sum(result.ticks for result in results)
+    elapsed = sum(result.elapsed for result in results)
+    for result in failures:
+        print(f"MISMATCH {result.path}: expected {result.expected}, got {result.actual}")
+    print(f"{len(results) - len(failures)}/{len(results)} recordings match, "
+          f"{ticks} ticks in {elapsed:.2f}s")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from map_cache import pack_compiled_map, view_compiled_map
+from simulation import MazeSimulation
+
+EpisodeResult = namedtuple('EpisodeResult', 'episode steps outcome')
+
+# The simulation each worker process builds once from the shared map, and the block it reads the map from
+worker_simulation = None
+worker_shared_map = None
+
+
+def random_policy(simulation, rng):
+    return rng.randrange(16)
+
+
+def episode_rng(seed, episode):
+    # Depends only on the seed and the episode number, never on which worker runs it
+    return random.Random(seed * 1_000_003 + episode)
+
+
+def outcome(simulation):
+    if simulation.game_over:
+        return 'game_over'
+    if simulation.instantDeath:
+        return 'instant_death'
+    if simulation.is_trapped:
+        return 'trapped'
+    return 'timeout'
+
+
+def run_episode(simulation, episode, seed, policy, max_steps):
+    rng = episode_rng(seed, episode)
+    simulation.restart_game()
+    steps = 0
+    while steps < max_steps and not simulation.done:
+        simulation.step(policy(simulation, rng))
+        steps += 1
+    return EpisodeResult(episode, steps, outcome(simulation))
+
+
+def init_worker(shared_name, size):
+    global worker_simulation, worker_shared_map
+    # The map's tiles stay in the shared block rather than being copied out, so the block is kept
+    # open for as long as the worker lives
+    worker_shared_map = shared_memory.SharedMemory(name=shared_name)
+    compiled_map = view_compiled_map(worker_shared_map.buf[:size])
+    worker_simulation = MazeSimulation(compiled_map=compiled_map)
+
+
+def run_chunk(episodes, seed, policy, max_steps):
+    return [run_episode(worker_simulation, episode, seed, policy, max_steps) for episode in episodes]
+
+
+def run_rollouts(num_episodes, policy=random_policy, seed=0, max_steps=10_000,
+                 workers=None, chunk_size=16, map_file=None):
+    """Yield an EpisodeResult for every episode, in episode order, as the worker processes finish them.
+
+    The compiled map is put in shared memory once and every worker reads its tiles from there.
+    workers=0 runs everything in this process. policy(simulation, rng) must be picklable.
+    """
+    compiled_map = MazeSimulation(map_file).compiled_map
+    chunks = [range(start, min(start + chunk_size, num_episodes))
+              for start in range(0, num_episodes, chunk_size)]
+
+    if workers == 0:
+        simulation = MazeSimulation(compiled_map=compiled_map)
+        for chunk in chunks:
+            for episode in chunk:
+                yield run_episode(simulation, episode, seed, policy, max_steps)
+        return
+
+    packed_map = pack_compiled_map(compiled_map)
+    shared_map = shared_memory.SharedMemory(create=True, size=len(packed_map))
+    try:
+        shared_map.buf[:len(packed_map)] = packed_map
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=init_worker,
+                                 initargs=(shared_map.name, len(packed_map))) as executor:
+            results = executor.map(run_chunk, chunks, [seed] * len(chunks),
+                                   [policy] * len(chunks), [max_steps] * len(chunks))
+            for chunk_results in results:
+                yield from chunk_results
+    finally:
+        shared_map.close()
+        shared_map.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless maze episodes across a process pool")
+    parser.add_argument('--episodes', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=10_000)
+    parser.add_argument('--map', default=None)
+    args = parser.parse_args()
+
+    outcomes = Counter()
+    total_steps = 0
+    for result in run_rollouts(args.episodes, seed=args.seed, max_steps=args.max_steps,
+                               workers=args.workers, map_file=args.map):
+        outcomes[result.outcome] += 1
+        total_steps += result.steps
+    print(f"{args.episodes} episodes, {total_steps} steps")
+    for name, count in outcomes.most_common():
+        print(f"  {name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
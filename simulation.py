@@ -0,0 +1,348 @@
+import csv
+from collections import namedtuple
+
+import pygame
+import pygame.math as math
+
+from chunked_map import ChunkStore, ChunkedTileGrid
+from map_cache import CACHE_EXTENSION, load_compiled_map, open_compiled_map
+from reachability import GridConnectivity
+from tiled_map import TiledMap
+from tile_grid import TileGrid
+from triggers import TriggerEngine, exit_zones
+
+# Constants
+BASE_IMG_PATH = 'Assets/'
+MAP_FILE = 'FinalMazeMap.json'
+WIDTH, HEIGHT = 660, 660
+CHARACTER_SPEED = 4
+TILE_SIZE = 12
+# Where the player starts on the shipped map; a map with a wall there starts on the open tile nearest to it
+SPAWN_CENTER = (200, HEIGHT)
+# Compiled maps with more tiles than this are kept in chunks loaded on demand rather than all in memory
+CHUNKED_MAP_TILES = 1 << 22
+
+# Input for one step is a bitmask of the held direction keys
+LEFT, RIGHT, UP, DOWN = 1, 2, 4, 8
+
+# The game's flags, in the order of their bits in flag_bits; batch_env, recording and solver use the same order
+FLAGS = ('is_trapped', 'reach_center', 'instantDeath', 'is_eligible', 'noEntry', 'game_over')
+EXIT_CLUES = 3
+
+# rect and exit_clue are tuples, active the trigger zones the player is in, tiles (x, y, value) triples
+Snapshot = namedtuple('Snapshot', 'rect flags exit_clue active tiles')
+
+
+def action_movement(action):
+    direction = math.Vector2(bool(action & RIGHT) - bool(action & LEFT),
+                             bool(action & DOWN) - bool(action & UP))
+    if direction.length() > 0:
+        direction.normalize_ip()
+    movement = direction * CHARACTER_SPEED
+    # Rect.move truncates, so diagonal moves are whole pixels too
+    return int(movement.x), int(movement.y)
+
+
+MOVES = [action_movement(action) for action in range(16)]
+
+
+class MazeSimulation:
+    """The game state and rules with no display: the player, the flags, the tile grid and its triggers.
+
+    step() advances one tick for an action bitmask, as fast as the caller wants.
+    MazeGame builds rendering and keyboard input on top of it.
+    """
+
+    def __init__(self, map_file=None, compiled_map=None, detect_traps=False, chunked=None):
+        self.map_file = map_file or BASE_IMG_PATH + MAP_FILE
+        self.compiled_map = compiled_map
+        # Set is_trapped whenever the player can no longer reach the exit, on top of the map's own trap zones
+        self.detect_traps = detect_traps
+        # True or False forces the chunked tile storage on or off, None picks it by map size
+        self.chunked = chunked
+        self.reset_flags()
+        self.initialize_map()
+
+    @property
+    def done(self):
+        return self.is_trapped or self.instantDeath or self.game_over
+
+    def get_wall_rects(self):
+        return [pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+                for x, y in self.map_creation.positions(0)]
+
+    def collides_with_wall(self, rect):
+        """Same result as testing rect against every wall rect, but only looks at the tiles under it."""
+        if rect.width <= 0 or rect.height <= 0:
+            return False
+        first_x = max(rect.left // TILE_SIZE, 0)
+        last_x = min((rect.right - 1) // TILE_SIZE, self.map_width - 1)
+        first_y = max(rect.top // TILE_SIZE, 0)
+        last_y = min((rect.bottom - 1) // TILE_SIZE, self.map_height - 1)
+        if first_x > last_x:
+            return False
+        for y in range(first_y, last_y + 1):
+            row_start = y * self.map_width
+            if self.wall_mask.find(1, row_start + first_x, row_start + last_x + 1) != -1:
+                return True
+        return False
+
+    def sweep_x(self, rect, dx):
+        """How far rect can move by dx before it runs into a wall, flush against it if it does.
+
+        Only the columns its leading edge crosses are looked at, nearest first, so a move of any
+        length stops at the first wall in the way instead of jumping over it.
+        """
+        first_y = max(rect.top // TILE_SIZE, 0)
+        last_y = min((rect.bottom - 1) // TILE_SIZE, self.map_height - 1)
+        if dx > 0:
+            first_x = max((rect.right - 1) // TILE_SIZE + 1, 0)
+            last_x = min((rect.right + dx - 1) // TILE_SIZE, self.map_width - 1)
+        else:
+            first_x = max((rect.left + dx) // TILE_SIZE, 0)
+            last_x = min(rect.left // TILE_SIZE - 1, self.map_width - 1)
+        if first_x > last_x:
+            return dx
+        nearest = None
+        for y in range(first_y, last_y + 1):
+            row_start = y * self.map_width
+            if dx > 0:
+                index = self.wall_mask.find(1, row_start + first_x, row_start + last_x + 1)
+                if index != -1 and (nearest is None or index - row_start < nearest):
+                    nearest = index - row_start
+            else:
+                index = self.wall_mask.rfind(1, row_start + first_x, row_start + last_x + 1)
+                if index != -1 and (nearest is None or index - row_start > nearest):
+                    nearest = index - row_start
+        if nearest is None:
+            return dx
+        return nearest * TILE_SIZE - rect.right if dx > 0 else (nearest + 1) * TILE_SIZE - rect.left
+
+    def sweep_y(self, rect, dy):
+        """sweep_x for a vertical move: the rows its leading edge crosses, nearest first."""
+        first_x = max(rect.left // TILE_SIZE, 0)
+        last_x = min((rect.right - 1) // TILE_SIZE, self.map_width - 1)
+        if dy > 0:
+            rows = range(max((rect.bottom - 1) // TILE_SIZE + 1, 0),
+                         min((rect.bottom + dy - 1) // TILE_SIZE, self.map_height - 1) + 1)
+        else:
+            rows = range(min(rect.top // TILE_SIZE - 1, self.map_height - 1),
+                         max((rect.top + dy) // TILE_SIZE, 0) - 1, -1)
+        if first_x > last_x:
+            return dy
+        for y in rows:
+            row_start = y * self.map_width
+            if self.wall_mask.find(1, row_start + first_x, row_start + last_x + 1) != -1:
+                return y * TILE_SIZE - rect.bottom if dy > 0 else (y + 1) * TILE_SIZE - rect.top
+        return dy
+
+    def load_map_from_csv(self, filename):
+        with open(filename, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            return [[int(tile) for tile in row] for row in reader]
+
+    def load_level(self, filename):
+        # A Tiled export carries its own trigger zones, a bare CSV map has none
+        if filename.endswith('.csv'):
+            rows, zones = self.load_map_from_csv(filename), []
+        else:
+            tiled_map = TiledMap(filename)
+            rows, zones = tiled_map.tile_grid(), tiled_map.trigger_zones()
+        if not any(zone.sets('game_over') for zone in zones):
+            zones += exit_zones(rows)
+        return rows, zones
+
+    def update_map(self, start_x, start_y, end_x, end_y, new_value):
+        self.pending_tiles.update(self.map_creation.fill_rect(start_x, start_y, end_x, end_y, new_value))
+        if not self.batch_map_updates:
+            self.commit_map_updates()
+
+    def commit_map_updates(self):
+        # Bring the wall mask and the connectivity in line with the tiles written since the last commit
+        if not self.pending_tiles:
+            return
+        for x, y in self.pending_tiles:
+            self.wall_mask[y * self.map_width + x] = 1 if self.map_creation[x, y] == 0 else 0
+        self.touched_tiles.update(self.pending_tiles)
+        if self.connectivity is not None:
+            self.connectivity.tiles_changed(self.pending_tiles)
+        self.pending_tiles.clear()
+
+    def get_connectivity(self):
+        """The connectivity of map_creation, built the first time something needs it since it reads the whole map."""
+        if self.connectivity is None:
+            self.connectivity = GridConnectivity(self.map_layout, self.door_tiles)
+            self.connectivity.attach(self.map_creation)
+            self.connectivity.tiles_changed(self.touched_tiles)
+        return self.connectivity
+
+    def player_tiles(self):
+        rect = self.player_rect
+        return [(x, y) for y in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1)
+                for x in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1)]
+
+    def can_reach_exit(self):
+        """True if the player can still get to a zone that ends the game.
+
+        Walls a reachable zone's triggers can open are not taken as final, so this is only False for a
+        real dead end. A map with neither a game_over zone nor exit tiles has nothing to reach, so it
+        is always True there.
+        """
+        if not self.exit_areas:
+            return True
+        return self.get_connectivity().reachable(self.player_tiles(), self.exit_areas, self.zone_openings)
+
+    def step(self, action):
+        if self.done:
+            return
+
+        dx, dy = MOVES[action & 15]
+        rect = self.player_rect
+        # x and y move one after the other, so a blocked axis stops against the wall while the other
+        # one still slides along it
+        if dx or dy:
+            stuck = self.collides_with_wall(rect)
+            start = rect.topleft
+            if dx:
+                rect.x += self.sweep_x(rect, dx)
+            if dy:
+                rect.y += self.sweep_y(rect, dy)
+            # The sweeps only look past the tiles the player is on, so a player a door closed on can
+            # step out of it, but never further in or along it
+            if stuck and self.collides_with_wall(rect):
+                rect.topleft = start
+
+        # The player stays on the map, however much of it the window shows
+        self.player_rect.x = max(0, min(self.player_rect.x, self.map_width * TILE_SIZE - self.player_rect.width))
+        self.player_rect.y = max(0, min(self.player_rect.y, self.map_height * TILE_SIZE - self.player_rect.height))
+
+        self.map_logic()
+
+    def run(self, actions):
+        """Step through an iterable of actions until it runs out or the game ends; returns the steps taken."""
+        steps = 0
+        for action in actions:
+            if self.done:
+                break
+            self.step(action)
+            steps += 1
+        return steps
+
+    def map_logic(self):
+        # Collect every tile write of this step and commit them to the wall mask once at the end
+        self.batch_map_updates = True
+        self.triggers.update(self, self.player_rect)
+        self.batch_map_updates = False
+        # Walking never leaves a connected area, so only tile changes can cut the player off
+        tiles_changed = bool(self.pending_tiles)
+        self.commit_map_updates()
+        if self.detect_traps and tiles_changed and not self.done and not self.can_reach_exit():
+            self.is_trapped = True
+
+    def initialize_player(self):
+        self.player_rect = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+        self.player_rect.center = SPAWN_CENTER
+        rect = self.player_rect
+        layout = self.map_layout
+        covered = [(x, y) for x, y in self.player_tiles() if layout.in_bounds(x, y)]
+        # Smaller maps leave the default spawn outside them altogether
+        if not covered or any(layout[x, y] == 0 for x, y in covered):
+            tile = self.nearest_open_tile(rect.left // TILE_SIZE, rect.top // TILE_SIZE)
+            if tile is not None:
+                rect.topleft = (tile[0] * TILE_SIZE, tile[1] * TILE_SIZE)
+
+    def nearest_open_tile(self, x, y):
+        """The tile nearest to (x, y) that is not a wall, searched ring by ring outwards; None on an all-wall map."""
+        layout = self.map_layout
+        for radius in range(max(x, y, self.map_width, self.map_height) + 1):
+            ring = [(x + dx, y + dy) for dx in range(-radius, radius + 1) for dy in (-radius, radius)]
+            ring += [(x + dx, y + dy) for dx in (-radius, radius) for dy in range(-radius + 1, radius)]
+            found = [(tile_x, tile_y) for tile_x, tile_y in ring
+                     if layout.in_bounds(tile_x, tile_y) and layout[tile_x, tile_y] != 0]
+            if found:
+                return min(found, key=lambda tile: (tile[0] - x) ** 2 + (tile[1] - y) ** 2)
+        return None
+
+    def initialize_map(self):
+        # Parsed once; restarts copy the pristine layout instead of reading the file again
+        if self.compiled_map is None and self.map_file.endswith(CACHE_EXTENSION):
+            self.compiled_map = open_compiled_map(self.map_file)
+        elif self.compiled_map is None:
+            self.compiled_map = load_compiled_map(self.map_file, self.load_level)
+        compiled_map = self.compiled_map
+        self.map_width = compiled_map.width
+        self.map_height = compiled_map.height
+        chunked = self.chunked
+        if chunked is None:
+            chunked = compiled_map.width * compiled_map.height > CHUNKED_MAP_TILES
+        if chunked:
+            # Restarts share the chunks read so far and only drop the ones the triggers wrote
+            self.map_layout = ChunkedTileGrid(ChunkStore(compiled_map.tiles, compiled_map.width, compiled_map.height))
+        else:
+            self.map_layout = TileGrid(compiled_map.width, compiled_map.height, compiled_map.tiles)
+        self.initialize_player()
+        self.triggers = TriggerEngine(compiled_map.trigger_zones, TILE_SIZE)
+        self.exit_areas = [zone.area for zone in self.triggers.zones if zone.sets('game_over')]
+        self.zone_openings = [(zone.area, zone.openings()) for zone in self.triggers.zones]
+        self.door_tiles = [tile for zone in self.triggers.zones for tile in zone.written_tiles()]
+        self.connectivity = None
+        self.reset_map()
+        self.initial_snapshot = self.snapshot()
+
+    def reset_map(self):
+        self.map_creation = self.map_layout.copy()
+        if self.connectivity is not None:
+            self.connectivity.attach(self.map_creation)
+        # Every tile written since the reset, all a snapshot has to look at
+        self.touched_tiles = set()
+        self.wall_mask = self.map_creation.wall_mask()
+        self.pending_tiles = set()
+        self.batch_map_updates = True
+        self.triggers.reset(self)
+        self.batch_map_updates = False
+        self.commit_map_updates()
+
+    def reset_flags(self):
+        self.is_trapped = False
+        self.reach_center = False
+        self.instantDeath = False
+        self.is_eligible = False
+        self.noEntry = False
+        self.exit_clue = [False] * EXIT_CLUES
+        self.game_over = False
+
+    def flag_bits(self):
+        # FLAGS packed into an int, bit i set when FLAGS[i] is
+        flags = 0
+        for bit, name in enumerate(FLAGS):
+            if getattr(self, name):
+                flags |= 1 << bit
+        return flags
+
+    def snapshot(self):
+        """The whole game state, small enough to take every step: the map is kept as the tiles written since the reset."""
+        grid = self.map_creation
+        return Snapshot(tuple(self.player_rect), self.flag_bits(), tuple(self.exit_clue), frozenset(self.triggers.active),
+                        tuple((x, y, grid[x, y]) for x, y in self.touched_tiles))
+
+    def restore(self, snapshot):
+        """Go back to a snapshot's state, writing only the tiles that differ from it."""
+        self.player_rect.update(snapshot.rect)
+        for bit, name in enumerate(FLAGS):
+            setattr(self, name, bool(snapshot.flags >> bit & 1))
+        self.exit_clue = list(snapshot.exit_clue)
+        self.triggers.active = set(snapshot.active)
+        grid, layout = self.map_creation, self.map_layout
+        tiles = {(x, y): value for x, y, value in snapshot.tiles}
+        # Tiles written since the snapshot that it does not hold go back to the layout
+        for position in self.touched_tiles.union(tiles):
+            value = tiles.get(position, layout[position])
+            if grid[position] != value:
+                grid[position] = value
+                self.pending_tiles.add(position)
+        self.touched_tiles = set(tiles)
+        self.commit_map_updates()
+
+    def restart_game(self):
+        # The state right after loading, without copying the map again
+        self.restore(self.initial_snapshot)
@@ -0,0 +1,712 @@
+import argparse
+import heapq
+import itertools
+import time
+from array import array
+from collections import deque
+
+import pygame
+
+from simulation import (TILE_SIZE, CHARACTER_SPEED, MOVES, EXIT_CLUES, FLAGS,
+                        LEFT, RIGHT, UP, DOWN, MazeSimulation)
+from triggers import TriggerEngine
+
+# Every action that moves the player; standing still never shortens a route
+MOVE_ACTIONS = tuple(action for action in range(16) if MOVES[action] != (0, 0) and MOVES.index(MOVES[action]) == action)
+# The route search moves a tile at a time in these, TICKS_PER_TILE ticks each
+CARDINAL_ACTIONS = (LEFT, RIGHT, UP, DOWN)
+TICKS_PER_TILE = TILE_SIZE // CHARACTER_SPEED
+# Ticks of any move the search tries to get a start off the tile grid onto it
+ALIGN_TICKS = 2 * TICKS_PER_TILE
+TRAPPED, DEAD, WON = FLAGS.index('is_trapped'), FLAGS.index('instantDeath'), FLAGS.index('game_over')
+INFINITY = float('inf')
+# The flags CONDITIONS['can_exit'] checks, as indices into a route state's flags
+WIN_FLAGS = (FLAGS.index('is_eligible'),) + tuple(len(FLAGS) + clue for clue in range(EXIT_CLUES))
+
+
+class SearchResult:
+    """A path of (x, y) tiles from start to goal (None if unreachable) and what it cost to find."""
+
+    def __init__(self, path, nodes_expanded, elapsed):
+        self.path = path
+        self.nodes_expanded = nodes_expanded
+        self.elapsed = elapsed
+
+    @property
+    def length(self):
+        return None if self.path is None else len(self.path) - 1
+
+    def __repr__(self):
+        return (f"SearchResult(length={self.length}, nodes_expanded={self.nodes_expanded}, "
+                f"elapsed={self.elapsed * 1000:.3f}ms)")
+
+
+class DistanceField:
+    """Steps from every tile to the nearest goal tile, -1 where no goal can be reached."""
+
+    def __init__(self, width, distances, nodes_expanded, elapsed):
+        self.width = width
+        self.distances = distances
+        self.nodes_expanded = nodes_expanded
+        self.elapsed = elapsed
+
+    def distance(self, x, y):
+        return self.distances[y * self.width + x]
+
+    def next_step(self, x, y):
+        """The neighbouring tile one step closer to a goal, or None at a goal or when cut off."""
+        index = y * self.width + x
+        distance = self.distances[index]
+        if distance <= 0:
+            return None
+        for neighbour in (index - 1, index + 1, index - self.width, index + self.width):
+            if 0 <= neighbour < len(self.distances) and self.distances[neighbour] == distance - 1:
+                if abs(neighbour % self.width - x) <= 1:
+                    return neighbour % self.width, neighbour // self.width
+        return None
+
+
+class GridSolver:
+    """Searches a TileGrid in place: every tile except walls (0) is walkable, moves are 4-way."""
+
+    def __init__(self, grid):
+        self.width = grid.width
+        self.height = grid.height
+        self.walls = grid.mask(0)
+
+    @classmethod
+    def from_simulation(cls, simulation):
+        return cls(simulation.map_creation)
+
+    def neighbours(self, index):
+        width = self.width
+        x = index % width
+        walls = self.walls
+        if x > 0 and not walls[index - 1]:
+            yield index - 1
+        if x < width - 1 and not walls[index + 1]:
+            yield index + 1
+        if index >= width and not walls[index - width]:
+            yield index - width
+        if index < len(walls) - width and not walls[index + width]:
+            yield index + width
+
+    def walkable(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height and not self.walls[y * self.width + x]
+
+    def build_path(self, parents, index):
+        path = []
+        while index != -1:
+            path.append((index % self.width, index // self.width))
+            index = parents[index]
+        path.reverse()
+        return path
+
+    def bfs(self, start, goal):
+        started = time.perf_counter()
+        if not (self.walkable(*start) and self.walkable(*goal)):
+            return SearchResult(None, 0, time.perf_counter() - started)
+        start_index = start[1] * self.width + start[0]
+        goal_index = goal[1] * self.width + goal[0]
+        parents = array('l', [-2]) * len(self.walls)
+        parents[start_index] = -1
+        queue = deque([start_index])
+        expanded = 0
+        while queue:
+            index = queue.popleft()
+            expanded += 1
+            if index == goal_index:
+                return SearchResult(self.build_path(parents, index), expanded, time.perf_counter() - started)
+            for neighbour in self.neighbours(index):
+                if parents[neighbour] == -2:
+                    parents[neighbour] = index
+                    queue.append(neighbour)
+        return SearchResult(None, expanded, time.perf_counter() - started)
+
+    def astar(self, start, goal):
+        started = time.perf_counter()
+        if not (self.walkable(*start) and self.walkable(*goal)):
+            return SearchResult(None, 0, time.perf_counter() - started)
+        width = self.width
+        goal_x, goal_y = goal
+        start_index = start[1] * width + start[0]
+        goal_index = goal_y * width + goal_x
+        parents = array('l', [-2]) * len(self.walls)
+        costs = array('l', [-1]) * len(self.walls)
+        parents[start_index] = -1
+        costs[start_index] = 0
+        heap = [(abs(start[0] - goal_x) + abs(start[1] - goal_y), 0, start_index)]
+        expanded = 0
+        while heap:
+            _, cost, index = heapq.heappop(heap)
+            if cost > costs[index]:
+                continue
+            expanded += 1
+            if index == goal_index:
+                return SearchResult(self.build_path(parents, index), expanded, time.perf_counter() - started)
+            for neighbour in self.neighbours(index):
+                if costs[neighbour] == -1 or cost + 1 < costs[neighbour]:
+                    costs[neighbour] = cost + 1
+                    parents[neighbour] = index
+                    estimate = abs(neighbour % width - goal_x) + abs(neighbour // width - goal_y)
+                    heapq.heappush(heap, (cost + 1 + estimate, cost + 1, neighbour))
+        return SearchResult(None, expanded, time.perf_counter() - started)
+
+    def bidirectional(self, start, goal):
+        """Breadth-first from both ends a whole layer at a time, always growing the smaller frontier."""
+        started = time.perf_counter()
+        if not (self.walkable(*start) and self.walkable(*goal)):
+            return SearchResult(None, 0, time.perf_counter() - started)
+        start_index = start[1] * self.width + start[0]
+        goal_index = goal[1] * self.width + goal[0]
+        if start_index == goal_index:
+            return SearchResult([start], 1, time.perf_counter() - started)
+        forward = array('l', [-2]) * len(self.walls)
+        backward = array('l', [-2]) * len(self.walls)
+        forward[start_index] = -1
+        backward[goal_index] = -1
+        forward_frontier, backward_frontier = [start_index], [goal_index]
+        expanded = 0
+        while forward_frontier and backward_frontier:
+            grow_forward = len(forward_frontier) <= len(backward_frontier)
+            frontier = forward_frontier if grow_forward else backward_frontier
+            parents, others = (forward, backward) if grow_forward else (backward, forward)
+            next_frontier = []
+            meeting = None
+            for index in frontier:
+                expanded += 1
+                for neighbour in self.neighbours(index):
+                    if parents[neighbour] == -2:
+                        parents[neighbour] = index
+                        next_frontier.append(neighbour)
+                        if others[neighbour] != -2 and meeting is None:
+                            meeting = neighbour
+            if meeting is not None:
+                path = self.build_path(forward, meeting)
+                index = backward[meeting]
+                while index != -1:
+                    path.append((index % self.width, index // self.width))
+                    index = backward[index]
+                return SearchResult(path, expanded, time.perf_counter() - started)
+            if grow_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return SearchResult(None, expanded, time.perf_counter() - started)
+
+    def distance_field(self, goals):
+        """Multi-source BFS from every walkable goal tile; query the result in O(1) per tile."""
+        started = time.perf_counter()
+        distances = array('l', [-1]) * len(self.walls)
+        queue = deque()
+        for x, y in goals:
+            if self.walkable(x, y) and distances[y * self.width + x] == -1:
+                distances[y * self.width + x] = 0
+                queue.append(y * self.width + x)
+        expanded = 0
+        while queue:
+            index = queue.popleft()
+            expanded += 1
+            distance = distances[index] + 1
+            for neighbour in self.neighbours(index):
+                if distances[neighbour] == -1:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+        return DistanceField(self.width, distances, expanded, time.perf_counter() - started)
+
+
+class RouteState:
+    """Just enough of MazeSimulation for TriggerEngine: the flags, and an update_map that writes door tiles."""
+
+    def __init__(self, solver, flags, doors):
+        self.solver = solver
+        for flag, value in zip(FLAGS, flags):
+            setattr(self, flag, value)
+        self.exit_clue = list(flags[len(FLAGS):])
+        self.doors = bytearray(doors)
+
+    def update_map(self, start_x, start_y, end_x, end_y, new_value):
+        for column in self.solver.action_columns[start_x, start_y, end_x, end_y]:
+            self.doors[column] = new_value
+
+    def flags(self):
+        return tuple(getattr(self, flag) for flag in FLAGS) + tuple(self.exit_clue)
+
+
+class RouteResult:
+    """The fewest ticks that win the level (None if it cannot be won) and what it cost to find.
+
+    Fewest among routes that stop on tiles, unless RouteSolver.solve was asked for the exact optimum.
+    """
+
+    def __init__(self, actions, states_expanded, elapsed):
+        self.actions = actions
+        self.states_expanded = states_expanded
+        self.elapsed = elapsed
+
+    @property
+    def winnable(self):
+        return self.actions is not None
+
+    def __repr__(self):
+        steps = None if self.actions is None else len(self.actions)
+        return (f"RouteResult(steps={steps}, states_expanded={self.states_expanded}, "
+                f"elapsed={self.elapsed * 1000:.3f}ms)")
+
+
+class RouteSolver:
+    """A* over (player position, active zones, flags, door tiles) using the level's own trigger zones.
+
+    Every tick is worked out the way MazeSimulation.step does it, triggers included. Door tiles are the
+    tiles any trigger action writes; every other tile keeps its layout value. By default the search only
+    visits tile-aligned states: between two of them the player holds one direction for the
+    TICKS_PER_TILE ticks it takes to cross a tile, so the route is only the fewest ticks among routes
+    that stop on tiles (757 rather than 747 on the shipped map, in under a second). solve(exact=True)
+    searches every tick and action from every pixel position for the true optimum, which takes seconds.
+    solve_level replays the route on the real simulation to confirm it wins.
+    Moves that trap or kill the player are pruned, which rules out bottomTunnelWall, leftTunnelWall,
+    bottomTrapWall and instantDeath before is_eligible on the shipped map. Trigger outcomes are memoized
+    on (zones before, zones after, flags, doors), so the many positions that share those only run the
+    actions once.
+    """
+
+    def __init__(self, simulation):
+        self.width = simulation.map_width
+        self.height = simulation.map_height
+        # A private engine, since firing triggers overwrites its set of active zones
+        self.engine = TriggerEngine(simulation.triggers.zones, TILE_SIZE)
+        self.door_index = {}
+        self.action_columns = {}
+        for zone in self.engine.zones:
+            for kind, target, value, condition in zone.enter + zone.exit + zone.inside:
+                if kind == 'tiles' and target not in self.action_columns:
+                    self.action_columns[target] = self.door_columns(*target)
+        self.static_walls = bytearray(simulation.map_layout.mask(0))
+        for x, y in self.door_index:
+            self.static_walls[y * self.width + x] = 0
+        self.door_tiles = sorted(self.door_index, key=self.door_index.get)
+        self.trigger_cache = {}
+        self.position_cache = {}
+        self.moves_cache = {}
+        self.tile_estimates = None
+        self.exact_estimates = None
+        self.relaxed_positions = {}
+
+    def door_columns(self, start_x, start_y, end_x, end_y):
+        columns = []
+        for y in range(max(start_y, 0), min(end_y, self.height - 1) + 1):
+            for x in range(max(start_x, 0), min(end_x, self.width - 1) + 1):
+                columns.append(self.door_index.setdefault((x, y), len(self.door_index)))
+        return columns
+
+    def start_state(self, simulation):
+        rect = simulation.player_rect
+        flags = tuple(getattr(simulation, flag) for flag in FLAGS) + tuple(simulation.exit_clue)
+        doors = bytes(simulation.map_creation[x, y] for x, y in self.door_tiles)
+        return rect.x, rect.y, frozenset(simulation.triggers.active), flags, doors
+
+    def position_info(self, x, y):
+        """What the player rect at (x, y) overlaps, cached per position.
+
+        Returns (hits a static wall, door columns, zones, whether any of the zones has inside actions).
+        """
+        info = self.position_cache.get((x, y))
+        if info is None:
+            # Same clipping as MazeSimulation.collides_with_wall
+            first_x, last_x = max(x // TILE_SIZE, 0), min((x + TILE_SIZE - 1) // TILE_SIZE, self.width - 1)
+            first_y, last_y = max(y // TILE_SIZE, 0), min((y + TILE_SIZE - 1) // TILE_SIZE, self.height - 1)
+            static_hit = False
+            columns = []
+            for tile_y in range(first_y, last_y + 1):
+                for tile_x in range(first_x, last_x + 1):
+                    column = self.door_index.get((tile_x, tile_y))
+                    if column is not None:
+                        columns.append(column)
+                    elif self.static_walls[tile_y * self.width + tile_x]:
+                        static_hit = True
+            zones = frozenset(self.engine.zones_at(pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)))
+            has_inside = any(self.engine.zones[zone_id].inside for zone_id in zones)
+            info = self.position_cache[x, y] = (static_hit, tuple(columns), zones, has_inside)
+        return info
+
+    def move(self, x, y, action):
+        """(door columns the move depends on, {open bit of each column: position it ends at}), cached.
+
+        The columns are the doors anywhere in the box the move sweeps, and every open/closed
+        combination of them is worked out up front.
+        """
+        move = self.moves_cache.get((x, y, action))
+        if move is None:
+            max_x, max_y = (self.width - 1) * TILE_SIZE, (self.height - 1) * TILE_SIZE
+            dx, dy = MOVES[action]
+            columns = sorted({self.door_index[tile] for tile in swept_tiles(x, y, dx, dy)
+                              if tile in self.door_index})
+            outcomes = {}
+            for doors_open in itertools.product((False, True), repeat=len(columns)):
+                open_columns = {column for column, is_open in zip(columns, doors_open) if is_open}
+                end_x, end_y = swept_move(x, y, dx, dy, self.wall_test(open_columns))
+                outcomes[doors_open] = max(0, min(end_x, max_x)), max(0, min(end_y, max_y))
+            move = self.moves_cache[x, y, action] = (tuple(columns), outcomes)
+        return move
+
+    def wall_test(self, open_columns):
+        """blocks(tile_x, tile_y) for swept_move, with only the door columns in open_columns open."""
+        width, height, static_walls, door_index = self.width, self.height, self.static_walls, self.door_index
+
+        def blocks(tile_x, tile_y):
+            # Off the map is open, as in MazeSimulation.collides_with_wall
+            if not (0 <= tile_x < width and 0 <= tile_y < height):
+                return False
+            if static_walls[tile_y * width + tile_x]:
+                return True
+            column = door_index.get((tile_x, tile_y))
+            return column is not None and column not in open_columns
+        return blocks
+
+    def step(self, state, action):
+        """The state after one MazeSimulation.step, or None when the game is already over."""
+        x, y, active, flags, doors = state
+        if flags[TRAPPED] or flags[DEAD] or flags[WON]:
+            return None
+        columns, outcomes = self.move(x, y, action)
+        x, y = outcomes[tuple(doors[column] != 0 for column in columns)]
+        _, _, current, has_inside = self.position_info(x, y)
+        if current == active and not has_inside:
+            # No transition and nothing to run inside: the triggers leave everything as it was
+            return x, y, current, flags, doors
+        key = (active, current, flags, doors)
+        result = self.trigger_cache.get(key)
+        if result is None:
+            route_state = RouteState(self, flags, doors)
+            self.engine.active = set(active)
+            self.engine.update(route_state, pygame.Rect(x, y, TILE_SIZE, TILE_SIZE))
+            result = self.trigger_cache[key] = (route_state.flags(), bytes(route_state.doors))
+        return (x, y, current) + result
+
+    def tile_step(self, state, action):
+        """Hold action until the player is on the next tile: (state, ticks), or None if it is stopped, trapped or killed.
+
+        Winning on the way ends the move early.
+        """
+        dx, dy = MOVES[action]
+        target = state[0] + dx * TICKS_PER_TILE, state[1] + dy * TICKS_PER_TILE
+        for tick in range(1, TICKS_PER_TILE + 1):
+            state = self.step(state, action)
+            flags = state[3]
+            if flags[TRAPPED] or flags[DEAD]:
+                return None
+            if flags[WON]:
+                return state, tick
+        return (state, TICKS_PER_TILE) if (state[0], state[1]) == target else None
+
+    def align(self, start):
+        """The tile-aligned (or won) states within ALIGN_TICKS of start, with the actions that reach each.
+
+        The shipped map starts the player off the tile grid, so a route begins with a few single ticks.
+        """
+        seen = {start: ()}
+        found = {}
+        frontier = [start]
+        for ticks in range(ALIGN_TICKS + 1):
+            next_frontier = []
+            for state in frontier:
+                if (state[0] % TILE_SIZE == 0 and state[1] % TILE_SIZE == 0) or state[3][WON]:
+                    found[state] = seen[state]
+                    continue
+                if ticks == ALIGN_TICKS:
+                    continue
+                for action in MOVE_ACTIONS:
+                    next_state = self.step(state, action)
+                    if next_state is None or next_state in seen:
+                        continue
+                    if next_state[3][TRAPPED] or next_state[3][DEAD]:
+                        continue
+                    seen[next_state] = seen[state] + (action,)
+                    next_frontier.append(next_state)
+            frontier = next_frontier
+        return found
+
+    def walkable(self, x, y):
+        # Doors count as open, so the estimates never assume a way is shut
+        return 0 <= x < self.width and 0 <= y < self.height and not self.static_walls[y * self.width + x]
+
+    def setter_zones(self, index, value=True):
+        """The ids of the zones whose enter or inside actions set flag index to value."""
+        return {zone_id for zone_id, zone in enumerate(self.engine.zones)
+                if any(kind == 'set' and action_value == value and self.flag_index(target) == index
+                       for kind, target, action_value, condition in zone.enter + zone.inside)}
+
+    def build_estimates(self, goals, field):
+        """(exit field, {waypoint: (goals, field)}, tours) from goals(index), the places touching a zone
+        that sets flag index, and field(goals), the distances from everywhere to them.
+
+        A route has to touch a zone setting each missing WIN_FLAGS flag, then a zone setting game_over.
+        """
+        exit_field = field(goals(WON))
+        waypoints = {}
+        for index in WIN_FLAGS:
+            index_goals = goals(index)
+            if index_goals:
+                waypoints[index] = (index_goals, field(index_goals))
+        # Fewest steps from any goal of one waypoint zone to another, or to the exit
+        legs = {}
+        for index, (index_goals, waypoint_field) in waypoints.items():
+            for other, (other_goals, other_field) in list(waypoints.items()) + [(WON, (None, exit_field))]:
+                legs[index, other] = min((other_field.get(goal, INFINITY) for goal in index_goals), default=INFINITY)
+        # Held-Karp over the waypoints: tours[index, rest] is the shortest relaxed route from waypoint
+        # index through every waypoint in rest, in any order, to the exit
+        tours = {}
+        for size in range(len(waypoints)):
+            for index in waypoints:
+                others = [other for other in waypoints if other != index]
+                for rest in itertools.combinations(others, size):
+                    tours[index, rest] = min(
+                        (legs[index, other] + tours[other, tuple(i for i in rest if i != other)]
+                         for other in rest), default=legs[index, WON])
+        return exit_field, waypoints, tours
+
+    def build_heuristic(self):
+        """Tile distances with every door open, for the tile-aligned search."""
+        def goals(index):
+            zones = [self.engine.zones[zone_id] for zone_id in self.setter_zones(index)]
+            return {tile for zone in zones for tile in zone.tiles() if self.walkable(*tile)}
+
+        def field(goals):
+            distances = dict.fromkeys(goals, 0)
+            queue = deque(goals)
+            while queue:
+                x, y = queue.popleft()
+                distance = distances[x, y] + 1
+                for neighbour in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                    if neighbour not in distances and self.walkable(*neighbour):
+                        distances[neighbour] = distance
+                        queue.append(neighbour)
+            return distances
+
+        self.tile_estimates = self.build_estimates(goals, field)
+
+    def build_exact_heuristic(self, start):
+        """Tick distances between every position reachable from start, with every door open or shut,
+        whichever is shorter, for the exact search."""
+        predecessors = {(start[0], start[1]): []}
+        queue = deque(predecessors)
+        while queue:
+            position = queue.popleft()
+            for action in MOVE_ACTIONS:
+                # Everywhere MazeSimulation.step can go with the doors in any state, so no real move is missing
+                for next_position in set(self.move(*position, action)[1].values()):
+                    if next_position not in predecessors:
+                        predecessors[next_position] = []
+                        queue.append(next_position)
+                    predecessors[next_position].append(position)
+
+        def goals(index):
+            zone_ids = self.setter_zones(index)
+            return [position for position in predecessors if self.position_info(*position)[2] & zone_ids]
+
+        def field(goals):
+            distances = dict.fromkeys(goals, 0)
+            queue = deque(goals)
+            while queue:
+                position = queue.popleft()
+                distance = distances[position] + 1
+                for previous in predecessors[position]:
+                    if previous not in distances:
+                        distances[previous] = distance
+                        queue.append(previous)
+            return distances
+
+        self.exact_estimates = self.build_estimates(goals, field)
+        self.relaxed_positions = predecessors
+
+    @staticmethod
+    def flag_index(target):
+        name, index = target
+        return len(FLAGS) + index if name == 'exit_clue' else FLAGS.index(name)
+
+    @staticmethod
+    def shortest_tour(estimates, position, flags):
+        # From position through every waypoint flags is missing to the exit, in the estimates' units
+        exit_field, waypoints, tours = estimates
+        missing = tuple(index for index in waypoints if not flags[index])
+        if not missing:
+            return exit_field.get(position, INFINITY)
+        return min(waypoints[index][1].get(position, INFINITY)
+                   + tours[index, tuple(other for other in missing if other != index)]
+                   for index in missing)
+
+    def heuristic(self, state):
+        """Fewest ticks, with every door open, from a tile-aligned state through every missing waypoint to the exit.
+
+        A tour of n tiles takes n tile moves, the last of which can win after a single tick.
+        INFINITY means even the open map has no way to win from here, so the state can be dropped.
+        """
+        if state[3][WON]:
+            return 0
+        tiles = self.shortest_tour(self.tile_estimates, (state[0] // TILE_SIZE, state[1] // TILE_SIZE), state[3])
+        return TICKS_PER_TILE * tiles - TICKS_PER_TILE + 1 if tiles else 0
+
+    def exact_heuristic(self, state):
+        """Fewest ticks from any position through every missing waypoint to the exit, with the doors relaxed."""
+        return self.shortest_tour(self.exact_estimates, (state[0], state[1]), state[3])
+
+    def solve(self, simulation, exact=False):
+        """A* for the fewest ticks that take simulation from its current state to game_over.
+
+        Moving tile by tile unless exact, see the class docstring.
+        """
+        started = time.perf_counter()
+        start = self.start_state(simulation)
+        if exact:
+            if (start[0], start[1]) not in self.relaxed_positions:
+                self.build_exact_heuristic(start)
+            starts, actions, heuristic = {start: ()}, MOVE_ACTIONS, self.exact_heuristic
+        else:
+            if self.tile_estimates is None:
+                self.build_heuristic()
+            starts, actions, heuristic = self.align(start), CARDINAL_ACTIONS, self.heuristic
+        parents = {}
+        heap = []
+        for state, moved in starts.items():
+            estimate = heuristic(state)
+            if estimate != INFINITY:
+                parents[state] = (len(moved), None, moved)
+                heap.append((len(moved) + estimate, len(moved), len(heap), state))
+        heapq.heapify(heap)
+        pushed = len(heap)
+        expanded = 0
+        while heap:
+            _, cost, _, state = heapq.heappop(heap)
+            if cost > parents[state][0]:
+                continue
+            if state[3][WON]:
+                return RouteResult(self.build_route(parents, state), expanded, time.perf_counter() - started)
+            expanded += 1
+            for action in actions:
+                if exact:
+                    next_state, ticks = self.step(state, action), 1
+                    if next_state is None or next_state[3][TRAPPED] or next_state[3][DEAD]:
+                        continue
+                else:
+                    moved = self.tile_step(state, action)
+                    if moved is None:
+                        continue
+                    next_state, ticks = moved
+                known = parents.get(next_state)
+                if known is not None and known[0] <= cost + ticks:
+                    continue
+                estimate = heuristic(next_state)
+                if estimate == INFINITY:
+                    continue
+                parents[next_state] = (cost + ticks, state, (action,) * ticks)
+                heapq.heappush(heap, (cost + ticks + estimate, cost + ticks, pushed, next_state))
+                pushed += 1
+        return RouteResult(None, expanded, time.perf_counter() - started)
+
+    @staticmethod
+    def build_route(parents, state):
+        moves = []
+        while state is not None:
+            _, state, actions = parents[state]
+            moves.append(actions)
+        moves.reverse()
+        return [action for actions in moves for action in actions]
+
+
+def swept_tiles(x, y, dx, dy):
+    """The tiles under a player tile anywhere between (x, y) and (x + dx, y + dy)."""
+    left, top = min(x, x + dx), min(y, y + dy)
+    right, bottom = max(x, x + dx) + TILE_SIZE - 1, max(y, y + dy) + TILE_SIZE - 1
+    return {(tile_x, tile_y) for tile_x in range(left // TILE_SIZE, right // TILE_SIZE + 1)
+            for tile_y in range(top // TILE_SIZE, bottom // TILE_SIZE + 1)}
+
+
+def swept_move(x, y, dx, dy, blocks):
+    """Where MazeSimulation.step's movement takes a player tile at (x, y), before it is clamped to the map.
+
+    blocks(tile_x, tile_y) tells the walls, so the solver can ask with its doors in any state.
+    """
+    def tiles(start):
+        return range(start // TILE_SIZE, (start + TILE_SIZE - 1) // TILE_SIZE + 1)
+
+    stuck = any(blocks(tile_x, tile_y) for tile_x in tiles(x) for tile_y in tiles(y))
+    end_x = x + sweep_axis(x, dx, lambda line: any(blocks(line, tile_y) for tile_y in tiles(y)))
+    end_y = y + sweep_axis(y, dy, lambda line: any(blocks(tile_x, line) for tile_x in tiles(end_x)))
+    # A player a door closed on only takes moves that step out of it
+    if stuck and any(blocks(tile_x, tile_y) for tile_x in tiles(end_x) for tile_y in tiles(end_y)):
+        return x, y
+    return end_x, end_y
+
+
+def sweep_axis(position, delta, blocked):
+    """How far a player tile at position moves by delta along one axis, stopping flush against the
+    first line of tiles its leading edge crosses that blocked(line) says it can't enter."""
+    if delta > 0:
+        first_line = (position + TILE_SIZE - 1) // TILE_SIZE + 1
+        for line in range(first_line, (position + TILE_SIZE + delta - 1) // TILE_SIZE + 1):
+            if blocked(line):
+                return line * TILE_SIZE - position - TILE_SIZE
+    elif delta < 0:
+        for line in range(position // TILE_SIZE - 1, (position + delta) // TILE_SIZE - 1, -1):
+            if blocked(line):
+                return (line + 1) * TILE_SIZE - position
+    return delta
+
+
+def verify_route(simulation, actions):
+    """Replay actions on a restarted simulation; True if they end the game by winning it."""
+    simulation.restart_game()
+    simulation.run(actions)
+    return simulation.game_over
+
+
+def solve_level(map_file=None, exact=False):
+    """Solve a level from its start; the route is replayed on a fresh simulation before it is returned."""
+    simulation = MazeSimulation(map_file)
+    result = RouteSolver(simulation).solve(simulation, exact)
+    if result.winnable and not verify_route(simulation, result.actions):
+        raise RuntimeError(f"Route for {simulation.map_file} does not replay to a win")
+    return result
+
+
+def player_tile(rect):
+    # The tile under the player's top-left corner; the start position hangs off the bottom of the map by its center
+    return rect.x // TILE_SIZE, rect.y // TILE_SIZE
+
+
+def zone_distance_fields(simulation, names=('trueExit', 'centerRectWall1')):
+    """Distance fields to the named trigger zones of a simulation, on its current tiles."""
+    solver = GridSolver.from_simulation(simulation)
+    return {zone.name: solver.distance_field(zone.tiles())
+            for zone in simulation.triggers.zones if zone.name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a maze map from the player's start tile")
+    parser.add_argument('--map', default=None)
+    parser.add_argument('--route', action='store_true',
+                        help="also solve the level with its triggers and print the winning route length")
+    parser.add_argument('--exact', action='store_true',
+                        help="with --route, search every tick for the optimum instead of moving tile by tile")
+    parser.add_argument('--goal', type=int, nargs=2, default=None, metavar=('X', 'Y'),
+                        help="goal tile; defaults to the last walkable tile of the map")
+    args = parser.parse_args()
+
+    simulation = MazeSimulation(args.map)
+    solver = GridSolver.from_simulation(simulation)
+    start = player_tile(simulation.player_rect)
+    goal = tuple(args.goal) if args.goal else None
+    if goal is None:
+        index = solver.walls.rfind(0)
+        goal = (index % solver.width, index // solver.width)
+    for name in ('bfs', 'astar', 'bidirectional'):
+        print(f"{name} to {goal}: {getattr(solver, name)(start, goal)}")
+    for name, field in zone_distance_fields(simulation).items():
+        print(f"distance to {name}: {field.distance(*start)} "
+              f"({field.nodes_expanded} nodes, {field.elapsed * 1000:.3f}ms)")
+    if args.route:
+        print(f"route: {solve_level(args.map, args.exact)}")
+
+
+if __name__ == "__main__":
+    main()
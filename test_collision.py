@@ -0,0 +1,59 @@
+import os
+import random
+import unittest
+
+# Headless, the simulation needs no window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from simulation import BASE_IMG_PATH, TILE_SIZE, MazeSimulation
+
+CSV_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), BASE_IMG_PATH, 'FinalMazeMap.csv')
+SEED = 2
+POSITIONS = 20000
+
+
+def rect_scan(wall_rects, rect):
+    # The collision test the game used before the tile lookup
+    return any(rect.colliderect(wall_rect) for wall_rect in wall_rects)
+
+
+class CollisionTest(unittest.TestCase):
+    """collides_with_wall against the old scan over every wall rect, on FinalMazeMap.csv."""
+
+    def setUp(self):
+        self.simulation = MazeSimulation(CSV_MAP)
+        self.rng = random.Random(SEED)
+        self.map_size = self.simulation.map_width * TILE_SIZE, self.simulation.map_height * TILE_SIZE
+
+    def random_rect(self, width=TILE_SIZE, height=TILE_SIZE):
+        # Reaching a little past every edge, where the tile lookup clips to the map
+        map_width, map_height = self.map_size
+        return pygame.Rect(self.rng.randrange(-2 * TILE_SIZE, map_width + TILE_SIZE),
+                           self.rng.randrange(-2 * TILE_SIZE, map_height + TILE_SIZE), width, height)
+
+    def assert_matches_scan(self, rects):
+        wall_rects = self.simulation.get_wall_rects()
+        for rect in rects:
+            self.assertEqual(self.simulation.collides_with_wall(rect), rect_scan(wall_rects, rect), rect)
+
+    def test_player_rects(self):
+        self.assert_matches_scan(self.random_rect() for _ in range(POSITIONS))
+
+    def test_other_sizes(self):
+        self.assert_matches_scan(self.random_rect(self.rng.randrange(0, 3 * TILE_SIZE),
+                                                  self.rng.randrange(0, 3 * TILE_SIZE))
+                                 for _ in range(POSITIONS // 4))
+
+    def test_after_tile_writes(self):
+        # The mask follows update_map, as the trigger zones open and close walls
+        simulation = self.simulation
+        for _ in range(50):
+            x, y = self.rng.randrange(simulation.map_width), self.rng.randrange(simulation.map_height)
+            simulation.update_map(x, y, x + self.rng.randrange(3), y + self.rng.randrange(3), self.rng.randrange(2))
+            self.assert_matches_scan(self.random_rect() for _ in range(POSITIONS // 50))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import random
+import unittest
+
+# Headless, the simulation needs no window
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+from batch_env import BatchMazeEnv, np
+from simulation import BASE_IMG_PATH, MAP_FILE, TILE_SIZE, LEFT, RIGHT, UP, DOWN, MazeSimulation
+from solver import swept_move
+
+JSON_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), BASE_IMG_PATH, MAP_FILE)
+SEED = 3
+POSITIONS = 3000
+# Up to far more than a tile a tick, where a destination-only check would jump over walls
+SPEEDS = (1, 3, 4, 11, 12, 13, 37, 200, 700)
+# Walking left from here into trueExit closes the door of column 3 on the player
+DOOR_START = (48, 204)
+DOOR_STUCK = (44, 204)
+
+
+def pixel_move(collides, rect, dx, dy):
+    # The reference: one pixel at a time, x then y, stopping before the first pixel that hits a wall
+    rect = rect.copy()
+    for delta, axis in ((dx, 0), (dy, 1)):
+        unit = (delta > 0) - (delta < 0)
+        for _ in range(abs(delta)):
+            moved = rect.move(unit if axis == 0 else 0, unit if axis == 1 else 0)
+            if collides(moved):
+                break
+            rect = moved
+    return rect.topleft
+
+
+class MovementTest(unittest.TestCase):
+    """Swept movement on the shipped map: no tunneling at any speed, and no getting stuck in a door."""
+
+    def setUp(self):
+        self.simulation = MazeSimulation(JSON_MAP)
+        self.rng = random.Random(SEED)
+
+    def open_positions(self, count):
+        simulation = self.simulation
+        while count:
+            rect = pygame.Rect(self.rng.randrange((simulation.map_width - 1) * TILE_SIZE),
+                               self.rng.randrange((simulation.map_height - 1) * TILE_SIZE), TILE_SIZE, TILE_SIZE)
+            if not simulation.collides_with_wall(rect):
+                count -= 1
+                yield rect
+
+    def blocks(self, tile_x, tile_y):
+        simulation = self.simulation
+        return simulation.map_creation.in_bounds(tile_x, tile_y) and simulation.map_creation[tile_x, tile_y] == 0
+
+    def test_no_tunneling(self):
+        simulation = self.simulation
+        for rect in self.open_positions(POSITIONS):
+            speed = self.rng.choice(SPEEDS)
+            dx, dy = self.rng.choice((-speed, 0, speed)), self.rng.choice((-speed, 0, speed))
+            expected = pixel_move(simulation.collides_with_wall, rect, dx, dy)
+            moved = rect.move(simulation.sweep_x(rect, dx), 0)
+            moved.move_ip(0, simulation.sweep_y(moved, dy))
+            self.assertEqual(moved.topleft, expected, (rect, dx, dy))
+            self.assertEqual(swept_move(rect.x, rect.y, dx, dy, self.blocks), expected, (rect, dx, dy))
+
+    def test_step_out_of_closed_door(self):
+        simulation = self.simulation
+        simulation.player_rect.topleft = DOOR_START
+        simulation.step(LEFT)
+        self.assertEqual(simulation.player_rect.topleft, DOOR_STUCK)
+        self.assertTrue(simulation.collides_with_wall(simulation.player_rect))
+        self.assertFalse(simulation.done)
+        # Further into the door, or along it, stays put; stepping back out is allowed
+        snapshot = simulation.snapshot()
+        for action in (LEFT, UP, DOWN, LEFT | UP, LEFT | DOWN, RIGHT | UP, RIGHT | DOWN):
+            simulation.step(action)
+            self.assertEqual(simulation.player_rect.topleft, DOOR_STUCK, action)
+            simulation.restore(snapshot)
+        simulation.step(RIGHT)
+        self.assertFalse(simulation.collides_with_wall(simulation.player_rect))
+        self.assertEqual(swept_move(*DOOR_STUCK, 4, 0, self.blocks), simulation.player_rect.topleft)
+
+    @unittest.skipIf(np is None, "BatchMazeEnv needs NumPy")
+    def test_batch_step_out_of_closed_door(self):
+        env = BatchMazeEnv(2, JSON_MAP)
+        env.x[:], env.y[:] = DOOR_START
+        env.step(np.array([LEFT, LEFT]))
+        self.assertEqual(env.positions().tolist(), [list(DOOR_STUCK)] * 2)
+        env.step(np.array([LEFT, RIGHT]))
+        self.assertEqual(env.positions().tolist(), [list(DOOR_STUCK), [DOOR_STUCK[0] + 4, DOOR_STUCK[1]]])
+
+
+if __name__ == "__main__":
+    unittest.main()
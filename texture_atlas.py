@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import struct
+
+import pygame
+
+ATLAS_EXTENSION = '.atlas'
+ATLAS_MAGIC = b'ATLS'
+ATLAS_VERSION = 2
+# magic, version, tile size, number of images, fingerprint of the source files, name table length
+HEADER = struct.Struct('<4sHII20sI')
+
+# Atlases already built in this process, per (image files, tile size, converted)
+loaded_atlases = {}
+
+
+class TextureAtlas:
+    """Every image scaled to one tile size and packed side by side into a single surface.
+
+    image(name) is a subsurface, so blits from it read straight out of the shared atlas pixels.
+    Images with no transparent pixels, like the map tiles, are read from opaque_surface, a copy of
+    the atlas without alpha once converted, so blitting them is a plain copy rather than a blend.
+    """
+
+    def __init__(self, surface, names, tile_size, opaque=(), opaque_surface=None):
+        self.surface = surface
+        self.opaque_surface = surface if opaque_surface is None else opaque_surface
+        self.tile_size = tile_size
+        self.rects = {name: pygame.Rect(index * tile_size, 0, tile_size, tile_size)
+                      for index, name in enumerate(names)}
+        self.opaque = set(opaque)
+
+    def image(self, name):
+        surface = self.opaque_surface if name in self.opaque else self.surface
+        return surface.subsurface(self.rects[name])
+
+    def converted(self):
+        """The atlas in the display's pixel format, so blits do not convert every pixel; needs a display mode."""
+        return TextureAtlas(self.surface.convert_alpha(), list(self.rects), self.tile_size, self.opaque,
+                            self.surface.convert())
+
+
+def atlas_path(images, tile_size):
+    directory = os.path.dirname(next(iter(images.values())))
+    return os.path.join(directory, f"tiles_{tile_size}{ATLAS_EXTENSION}")
+
+
+def fingerprint(images, tile_size):
+    # Names, sizes and modification times of the sources: enough to notice a replaced image
+    digest = hashlib.sha1(str(tile_size).encode())
+    for name, path in images.items():
+        stat = os.stat(path)
+        digest.update(f"{name}\0{path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return digest.digest()
+
+
+def build_atlas(images, tile_size):
+    """Decode and scale every image once; images maps names to file paths."""
+    surface = pygame.Surface((tile_size * len(images), tile_size), pygame.SRCALPHA)
+    opaque = []
+    for index, (name, path) in enumerate(images.items()):
+        image = pygame.transform.scale(pygame.image.load(path), (tile_size, tile_size))
+        # Every pixel above alpha 254, which is every pixel of an image without an alpha channel
+        if pygame.mask.from_surface(image, 254).count() == tile_size * tile_size:
+            opaque.append(name)
+        surface.blit(image, (index * tile_size, 0))
+    return TextureAtlas(surface, list(images), tile_size, opaque)
+
+
+def pack_atlas(atlas, digest):
+    """Header, the names and the opaque ones as JSON, then the raw RGBA pixels of the scaled atlas."""
+    name_table = json.dumps({'names': list(atlas.rects), 'opaque': sorted(atlas.opaque)}).encode()
+    header = HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, atlas.tile_size, len(atlas.rects), digest, len(name_table))
+    return header + name_table + pygame.image.tobytes(atlas.surface, 'RGBA')
+
+
+def unpack_atlas(data, digest):
+    """Return the TextureAtlas stored in data, or None if it is not a valid atlas for these sources."""
+    if len(data) < HEADER.size:
+        return None
+    magic, version, tile_size, count, stored_digest, table_length = HEADER.unpack_from(data)
+    if magic != ATLAS_MAGIC or version != ATLAS_VERSION or stored_digest != digest:
+        return None
+    pixels = data[HEADER.size + table_length:]
+    size = (tile_size * count, tile_size)
+    if len(pixels) != size[0] * size[1] * 4:
+        return None
+    name_table = json.loads(data[HEADER.size:HEADER.size + table_length].decode())
+    return TextureAtlas(pygame.image.frombytes(pixels, size, 'RGBA'), name_table['names'], tile_size,
+                        name_table['opaque'])
+
+
+def load_atlas(images, tile_size):
+    """The atlas of images at tile_size, from memory, then the on-disk cache, then the source files.
+
+    When a display mode is set the result is converted to the display format.
+    """
+    key = (tuple(images.items()), tile_size, pygame.display.get_surface() is not None)
+    atlas = loaded_atlases.get(key)
+    if atlas is not None:
+        return atlas
+
+    digest = fingerprint(images, tile_size)
+    path = atlas_path(images, tile_size)
+    atlas = None
+    try:
+        with open(path, 'rb') as atlas_file:
+            atlas = unpack_atlas(atlas_file.read(), digest)
+    except (OSError, ValueError):
+        pass
+    if atlas is None:
+        atlas = build_atlas(images, tile_size)
+        try:
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as atlas_file:
+                atlas_file.write(pack_atlas(atlas, digest))
+            os.replace(temp_path, path)
+        except OSError:
+            # A read-only asset directory just means no cache
+            pass
+
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.converted()
+    loaded_atlases[key] = atlas
+    return atlas
@@ -0,0 +1,89 @@
+class TileGrid:
+    """A width x height grid of byte-sized tile values stored row-major in one bytearray.
+
+    Index with grid[x, y]. Rectangle arguments are inclusive tile corners, like update_map's.
+    """
+
+    def __init__(self, width, height, data=None):
+        self.width = width
+        self.height = height
+        self.data = bytearray(width * height) if data is None else bytearray(data)
+        if len(self.data) != width * height:
+            raise ValueError(f"Expected {width * height} tiles, got {len(self.data)}")
+
+    @classmethod
+    def from_rows(cls, rows):
+        height = len(rows)
+        width = max((len(row) for row in rows), default=0)
+        grid = cls(width, height)
+        for y, row in enumerate(rows):
+            if any(tile < 0 or tile > 255 for tile in row):
+                raise ValueError("Tile values must fit in a byte")
+            grid.data[y * width:y * width + len(row)] = bytes(row)
+        return grid
+
+    def __getitem__(self, position):
+        x, y = position
+        return self.data[y * self.width + x]
+
+    def __setitem__(self, position, value):
+        x, y = position
+        self.data[y * self.width + x] = value
+
+    def __eq__(self, other):
+        if not isinstance(other, TileGrid):
+            return NotImplemented
+        return (self.width, self.height, self.data) == (other.width, other.height, other.data)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def row(self, y, start_x=0, end_x=None):
+        """The tiles of row y, or of its [start_x, end_x) part."""
+        offset = y * self.width
+        return self.data[offset + start_x:offset + (self.width if end_x is None else end_x)]
+
+    def rows(self):
+        return [list(self.row(y)) for y in range(self.height)]
+
+    def copy(self):
+        return TileGrid(self.width, self.height, self.data)
+
+    def fill_rect(self, start_x, start_y, end_x, end_y, value):
+        """Set every tile of the rectangle (clipped to the grid) and return the positions that changed."""
+        start_x, end_x = max(start_x, 0), min(end_x, self.width - 1)
+        start_y, end_y = max(start_y, 0), min(end_y, self.height - 1)
+        changed = []
+        if start_x > end_x:
+            return changed
+        span = end_x - start_x + 1
+        filled = bytes((value,)) * span
+        for y in range(start_y, end_y + 1):
+            offset = y * self.width + start_x
+            if self.data[offset:offset + span] == filled:
+                continue
+            changed.extend((start_x + i, y) for i in range(span) if self.data[offset + i] != value)
+            self.data[offset:offset + span] = filled
+        return changed
+
+    def mask(self, *values):
+        """One byte per tile, 1 where the tile holds one of values."""
+        table = bytearray(256)
+        for value in values:
+            table[value] = 1
+        return self.data.translate(table)
+
+    def preload(self, start_x, start_y, end_x, end_y):
+        # Every tile is in memory already; ChunkedTileGrid loads the chunks here
+        pass
+
+    def wall_mask(self):
+        """The mask of the walls (tile 0) that MazeSimulation collides against."""
+        return self.mask(0)
+
+    def positions(self, value):
+        """Yield (x, y) of every tile holding value, scanning with bytearray.find."""
+        index = self.data.find(value)
+        while index != -1:
+            yield index % self.width, index // self.width
+            index = self.data.find(value, index + 1)
@@ -0,0 +1,122 @@
+import base64
+import gzip
+import json
+import os
+import sys
+import zlib
+from array import array
+
+from triggers import TriggerZone, parse_actions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tiled keeps the flip/rotation flags in the top bits of every gid
+GID_MASK = 0x0FFFFFFF
+EMPTY_TILE_VALUE = 1
+
+
+def get_properties(element):
+    return {prop['name']: prop['value'] for prop in element.get('properties', [])}
+
+
+def decode_layer_data(layer):
+    """Return the gids of a tile layer as a flat array, whatever encoding Tiled used."""
+    data = layer['data']
+    if layer.get('encoding', 'csv') == 'csv':
+        gids = array('I', data)
+    else:
+        raw = base64.b64decode(data)
+        compression = layer.get('compression', '')
+        if compression == 'zlib':
+            raw = zlib.decompress(raw)
+        elif compression == 'gzip':
+            raw = gzip.decompress(raw)
+        elif compression == 'zstd':
+            if zstandard is None:
+                raise ValueError("zstd compressed layers need the 'zstandard' package")
+            raw = zstandard.ZstdDecompressor().decompress(raw)
+        elif compression:
+            raise ValueError(f"Unsupported layer compression: {compression}")
+        gids = array('I')
+        gids.frombytes(raw)
+        if sys.byteorder == 'big':
+            gids.byteswap()
+    if any(gid > GID_MASK for gid in gids):
+        gids = array('I', (gid & GID_MASK for gid in gids))
+    return gids
+
+
+class TiledMap:
+    """The parts of a Tiled JSON export the game uses: tile layers, trigger objects and tile values."""
+
+    def __init__(self, filename):
+        with open(filename) as json_file:
+            data = json.load(json_file)
+        if data.get('infinite'):
+            raise ValueError("Infinite Tiled maps are not supported")
+
+        self.width = data['width']
+        self.height = data['height']
+        self.tile_width = data['tilewidth']
+        self.tile_height = data['tileheight']
+        self.properties = get_properties(data)
+        self.tile_values = self.load_tile_values(data['tilesets'], os.path.dirname(filename))
+
+        self.tile_layers = {}
+        self.object_layers = {}
+        for layer in data['layers']:
+            if layer['type'] == 'tilelayer':
+                self.tile_layers[layer['name']] = decode_layer_data(layer)
+            elif layer['type'] == 'objectgroup':
+                self.object_layers[layer['name']] = layer['objects']
+
+    @staticmethod
+    def load_tile_values(tilesets, base_dir):
+        # gid -> game tile value, from a 'tile_value' property on the tileset or on single tiles
+        tile_values = {}
+        for tileset in tilesets:
+            first_gid = tileset['firstgid']
+            if 'source' in tileset:
+                if not tileset['source'].endswith(('.json', '.tsj')):
+                    raise ValueError(f"Only JSON tilesets are supported: {tileset['source']}")
+                with open(os.path.join(base_dir, tileset['source'])) as json_file:
+                    tileset = json.load(json_file)
+            tileset_value = get_properties(tileset).get('tile_value')
+            if tileset_value is not None:
+                for tile_id in range(tileset.get('tilecount', 1)):
+                    tile_values[first_gid + tile_id] = tileset_value
+            for tile in tileset.get('tiles', []):
+                tile_value = get_properties(tile).get('tile_value')
+                if tile_value is not None:
+                    tile_values[first_gid + tile['id']] = tile_value
+        return tile_values
+
+    def tile_grid(self, layer_name=None):
+        """Convert a tile layer (the first one by default) to the rows of tile values the game plays on."""
+        gids = self.tile_layers[layer_name] if layer_name else next(iter(self.tile_layers.values()))
+        empty_value = self.properties.get('empty_tile_value', EMPTY_TILE_VALUE)
+        lookup = [self.tile_values.get(gid, empty_value) for gid in range(max(gids, default=0) + 1)]
+        return [[lookup[gid] for gid in gids[y * self.width:(y + 1) * self.width]]
+                for y in range(self.height)]
+
+    def trigger_zones(self):
+        """Build a TriggerZone for every rectangle object of type 'trigger', in layer order."""
+        zones = []
+        for objects in self.object_layers.values():
+            for obj in objects:
+                if obj.get('type', obj.get('class')) != 'trigger':
+                    continue
+                properties = get_properties(obj)
+                area = (round(obj['x'] / self.tile_width),
+                        round(obj['y'] / self.tile_height),
+                        round((obj['x'] + obj['width']) / self.tile_width) - 1,
+                        round((obj['y'] + obj['height']) / self.tile_height) - 1)
+                zones.append(TriggerZone(obj['name'], area,
+                                         enter=parse_actions(properties.get('enter', '')),
+                                         exit=parse_actions(properties.get('exit', '')),
+                                         inside=parse_actions(properties.get('inside', '')),
+                                         watch=properties.get('watch', '').split()))
+        return zones
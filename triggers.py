@@ -0,0 +1,217 @@
+# Tile value of the exit, where maps without a game_over trigger are won
+EXIT_TILE = 2
+
+# Conditions that are not plain flag names
+CONDITIONS = {
+    'can_exit': lambda state: state.is_eligible and state.exit_clue == [True, True, True],
+}
+
+
+def check_condition(state, condition):
+    if condition is None:
+        return True
+    negate = condition.startswith('!')
+    name = condition.lstrip('!')
+    value = CONDITIONS[name](state) if name in CONDITIONS else getattr(state, name)
+    return not value if negate else bool(value)
+
+
+def parse_flag(name):
+    """Split 'exit_clue[2]' into ('exit_clue', 2); plain flags get index None."""
+    if name.endswith(']'):
+        name, index = name[:-1].split('[')
+        return name, int(index)
+    return name, None
+
+
+def parse_value(word):
+    if word in ('true', 'false'):
+        return word == 'true'
+    return int(word)
+
+
+def parse_actions(text):
+    """Parse one action per line, 'tiles x1 y1 x2 y2 value' or 'set flag value', each optionally ending in 'if condition'."""
+    actions = []
+    for line in text.splitlines():
+        words = line.split()
+        if not words:
+            continue
+        condition = None
+        if 'if' in words:
+            condition = words[words.index('if') + 1]
+            words = words[:words.index('if')]
+        if words[0] == 'tiles' and len(words) == 6:
+            actions.append(('tiles', tuple(int(word) for word in words[1:5]), int(words[5]), condition))
+        elif words[0] == 'set' and len(words) == 3:
+            actions.append(('set', words[1], parse_value(words[2]), condition))
+        else:
+            raise ValueError(f"Invalid trigger action: {line.strip()}")
+    return actions
+
+
+class TriggerZone:
+    """A rectangle of tiles (inclusive corners) with the actions fired when the player enters or leaves it.
+
+    Actions are ('tiles', (start_x, start_y, end_x, end_y), value[, condition])
+    or ('set', flag, value[, condition]), where a flag may be indexed like 'exit_clue[0]'.
+    Exit actions double as the zone's initial state when the map is loaded.
+    """
+
+    def __init__(self, name, area, enter=(), exit=(), inside=(), watch=()):
+        self.name = name
+        self.area = tuple(area)
+        self.enter = [self.build_action(action) for action in enter]
+        self.exit = [self.build_action(action) for action in exit]
+        self.inside = [self.build_action(action) for action in inside]
+        self.watch = tuple(watch)
+
+    @staticmethod
+    def build_action(action):
+        kind, target, value = action[:3]
+        condition = action[3] if len(action) > 3 else None
+        if kind == 'tiles':
+            target = tuple(target)
+        elif kind == 'set':
+            target = parse_flag(target)
+        else:
+            raise ValueError(f"Unknown trigger action: {kind}")
+        return kind, target, value, condition
+
+    @staticmethod
+    def action_spec(action):
+        kind, target, value, condition = action
+        if kind == 'set':
+            name, index = target
+            target = name if index is None else f"{name}[{index}]"
+        return [kind, target, value, condition]
+
+    def spec(self):
+        """A JSON-friendly description of the zone that from_spec turns back into a TriggerZone."""
+        return {
+            'name': self.name,
+            'area': list(self.area),
+            'enter': [self.action_spec(action) for action in self.enter],
+            'exit': [self.action_spec(action) for action in self.exit],
+            'inside': [self.action_spec(action) for action in self.inside],
+            'watch': list(self.watch),
+        }
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(spec['name'], spec['area'], spec['enter'], spec['exit'], spec['inside'], spec['watch'])
+
+    def sets(self, name, index=None, value=True):
+        """True if entering or standing in the zone can set the flag to value."""
+        return any(kind == 'set' and target == (name, index) and action_value == value
+                   for kind, target, action_value, condition in self.enter + self.inside)
+
+    def openings(self):
+        """The tile areas the zone's actions can open, that is set to anything but a wall."""
+        return [target for kind, target, value, condition in self.enter + self.exit + self.inside
+                if kind == 'tiles' and value != 0]
+
+    def written_tiles(self):
+        """Every tile one of the zone's actions can write."""
+        for kind, target, value, condition in self.enter + self.exit + self.inside:
+            if kind == 'tiles':
+                start_x, start_y, end_x, end_y = target
+                for y in range(start_y, end_y + 1):
+                    for x in range(start_x, end_x + 1):
+                        yield x, y
+
+    def tiles(self):
+        start_x, start_y, end_x, end_y = self.area
+        for y in range(start_y, end_y + 1):
+            for x in range(start_x, end_x + 1):
+                yield x, y
+
+
+def exit_zone(area):
+    return TriggerZone('exit', area, enter=[('set', 'game_over', True)])
+
+
+def exit_zones(rows):
+    """Zones that end the game on the exit tiles of rows, one per run of them in a row.
+
+    For maps whose triggers never set game_over, such as bare CSV maps, so they can still be won.
+    """
+    zones = []
+    for y, row in enumerate(rows):
+        row = list(row)
+        x = 0
+        while x < len(row):
+            if row[x] == EXIT_TILE:
+                start_x = x
+                while x + 1 < len(row) and row[x + 1] == EXIT_TILE:
+                    x += 1
+                zones.append(exit_zone((start_x, y, x, y)))
+            x += 1
+    return zones
+
+
+class TriggerEngine:
+    """Fires zone actions on enter/exit transitions, found through a tile -> zones index."""
+
+    def __init__(self, zones, tile_size):
+        self.zones = list(zones)
+        self.tile_size = tile_size
+        self.zone_index = {}
+        self.watchers = {}
+        for zone_id, zone in enumerate(self.zones):
+            for tile in zone.tiles():
+                self.zone_index.setdefault(tile, []).append(zone_id)
+            for flag in zone.watch:
+                self.watchers.setdefault(flag, []).append(zone_id)
+        self.active = set()
+
+    def reset(self, state):
+        self.active = set()
+        for zone in self.zones:
+            self.run(state, zone.exit)
+
+    def zones_at(self, rect):
+        # Zones are whole tiles, so overlapping one of their tiles is the same as colliding with them
+        zone_ids = set()
+        if rect.width <= 0 or rect.height <= 0:
+            return zone_ids
+        for y in range(rect.top // self.tile_size, (rect.bottom - 1) // self.tile_size + 1):
+            for x in range(rect.left // self.tile_size, (rect.right - 1) // self.tile_size + 1):
+                zone_ids.update(self.zone_index.get((x, y), ()))
+        return zone_ids
+
+    def update(self, state, player_rect):
+        current = self.zones_at(player_rect)
+        changed_flags = set()
+        for zone_id in sorted(current ^ self.active):
+            zone = self.zones[zone_id]
+            changed_flags |= self.run(state, zone.enter if zone_id in current else zone.exit)
+        for zone_id in sorted(current):
+            if self.zones[zone_id].inside:
+                changed_flags |= self.run(state, self.zones[zone_id].inside)
+        self.active = current
+
+        # Zones whose actions depend on a flag that just changed re-apply their current state
+        refresh = {zone_id for flag in changed_flags for zone_id in self.watchers.get(flag, ())}
+        for zone_id in sorted(refresh):
+            zone = self.zones[zone_id]
+            self.run(state, zone.enter if zone_id in current else zone.exit)
+
+    def run(self, state, actions):
+        changed_flags = set()
+        for kind, target, value, condition in actions:
+            if not check_condition(state, condition):
+                continue
+            if kind == 'tiles':
+                state.update_map(*target, value)
+                continue
+            name, index = target
+            if index is None:
+                if getattr(state, name) != value:
+                    setattr(state, name, value)
+                    changed_flags.add(name)
+            elif getattr(state, name)[index] != value:
+                getattr(state, name)[index] = value
+                changed_flags.add(name)
+        return changed_flags
+